@@ -9,6 +9,7 @@ import json
 from pathlib import Path
 from datetime import datetime
 import shutil
+import sys
 
 # Chemins
 BASE_DIR = Path("/Users/julienmarboeuf/Documents/BON PLEIN/WATCHAI")
@@ -17,6 +18,16 @@ MASTER_DATA = BASE_DIR / "Master_Data"
 VALIDATION_DIR = BASE_DIR / "Validation"
 BACKUPS_DIR = BASE_DIR / "Backups"
 
+# Modules partagés avec la webapp (format du store partitionné), relatifs au dépôt
+WEBAPP_DIR = Path(__file__).resolve().parent.parent / "Webapp"
+sys.path.insert(0, str(WEBAPP_DIR))
+from master_store import (
+    MASTER_SHEETS, store_dir, manifest_path, load_manifest, append_to_store,
+    build_store_from_sheets, backfill_cube, read_master_store, store_to_sheets,
+    store_is_current, record_source
+)
+from data_fingerprint import file_fingerprint
+
 def get_country_code_mapping():
     """Mapping des noms de pays vers codes ISO"""
     return {
@@ -362,36 +373,165 @@ def transform_monthly_data_to_master_format(filepath, entity_mappings):
         return None, None, 0, 0
 
 def backup_master_database():
-    """Crée une sauvegarde du master avant intégration"""
+    """
+    Crée une sauvegarde du master avant intégration
+
+    Copie de DB_Shipping_Master.xlsx et, avec le store partitionné
+    (append-only), de son manifest : il suffit à restaurer l'état précédent
+    du store.
+
+    Returns:
+        Chemin de la sauvegarde de l'Excel (sinon du manifest), None en cas d'échec
+    """
     master_file = MASTER_DATA / "DB_Shipping_Master.xlsx"
-    
-    if not master_file.exists():
+    store_manifest = manifest_path(store_dir(master_file))
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+
+    sources = []
+    if master_file.exists():
+        sources.append((master_file, f"DB_Shipping_Master_backup_{timestamp}.xlsx"))
+    if store_manifest.exists():
+        sources.append((store_manifest, f"DB_Shipping_Store_manifest_backup_{timestamp}.json"))
+    if not sources:
         print("⚠️ Fichier master non trouvé")
         return None
     
     # Créer dossier backups
     BACKUPS_DIR.mkdir(exist_ok=True)
     
-    # Nom de sauvegarde avec timestamp
-    backup_name = f"DB_Shipping_Master_backup_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
-    backup_path = BACKUPS_DIR / backup_name
-    
     try:
-        shutil.copy2(master_file, backup_path)
-        print(f"✅ Sauvegarde créée: {backup_name}")
-        return backup_path
+        backups = []
+        for source, backup_name in sources:
+            backups.append(BACKUPS_DIR / backup_name)
+            shutil.copy2(source, backups[-1])
+            print(f"✅ Sauvegarde créée: {backup_name}")
+        return backups[0]
     except Exception as e:
         print(f"❌ Erreur sauvegarde: {e}")
         return None
 
-def integrate_selected_files(selected_file_paths, validation_file=None, dry_run=False):
+def write_master_excel(sheets, master_file):
+    """Écrit les feuilles dans DB_Shipping_Master.xlsx avec gestion d'erreur pour gros fichiers"""
+    import time
+    max_retries = 3
+    for attempt in range(max_retries):
+        try:
+            # Créer un fichier temporaire d'abord
+            temp_file = master_file.parent / f"temp_{master_file.name}"
+
+            with pd.ExcelWriter(temp_file, engine='openpyxl') as writer:
+                for sheet_name, df in sheets.items():
+                    print(f"   Écriture feuille {sheet_name}: {len(df):,} lignes...")
+                    df.to_excel(writer, sheet_name=sheet_name, index=False)
+
+            # Si succès, remplacer le fichier original
+            if temp_file.exists():
+                shutil.move(str(temp_file), str(master_file))
+            break
+
+        except (TimeoutError, OSError) as e:
+            print(f"⚠️  Tentative {attempt + 1}/{max_retries} échouée: {e}")
+            if temp_file.exists():
+                temp_file.unlink()
+            if attempt < max_retries - 1:
+                print("   Attente 5 secondes avant retry...")
+                time.sleep(5)
+            else:
+                raise Exception(f"Impossible d'écrire le fichier après {max_retries} tentatives")
+
+    print(f"📊 Taille finale: {master_file.stat().st_size / (1024*1024):.1f} MB")
+
+def ensure_master_store(master_file):
+    """
+    Retourne le store partitionné, (re)construit depuis l'Excel si besoin
+
+    Le store est construit lors de la première intégration, et reconstruit si
+    DB_Shipping_Master.xlsx a changé depuis (remplacement, restauration d'une
+    sauvegarde) : l'ancien store est supprimé une fois le nouveau en place.
     """
-    Intègre des fichiers spécifiques sélectionnés dans DB_Shipping_Master.xlsx
+    store = store_dir(master_file)
+    manifest = load_manifest(store)
+
+    if not store_is_current(master_file, manifest):
+        if manifest is None:
+            print("📦 Initialisation du store partitionné depuis DB_Shipping_Master.xlsx...")
+        else:
+            print("⚠️ DB_Shipping_Master.xlsx diffère du store : reconstruction depuis l'Excel...")
+
+        # Empreinte relevée avant la lecture : un Excel modifié pendant la lecture reste détecté
+        source = file_fingerprint(master_file)
+        with pd.ExcelFile(master_file, engine='openpyxl') as xls:
+            sheets = {sheet_name: pd.read_excel(xls, sheet_name=sheet_name) for sheet_name in xls.sheet_names}
+
+        try:
+            manifest = build_store_from_sheets(sheets, store, source=source, replace=manifest is not None)
+            print(f"✅ Store initialisé: {len(manifest['partitions'])} partitions")
+        except FileExistsError:
+            print("ℹ️ Store initialisé entre-temps par un autre processus")
+
+    # Fragments de cube OLAP des partitions créées avant le cube
+    written = backfill_cube(store)
+    if written:
+        print(f"🧊 Cube OLAP: {written} fragments de partition générés")
+
+    return store
+
+def export_master_excel(master_file):
+    """Régénère DB_Shipping_Master.xlsx depuis le store (export complet, coût proportionnel à l'historique)"""
+    print("📤 Export du store vers DB_Shipping_Master.xlsx...")
+    store = store_dir(master_file)
+    df = read_master_store(store)
+    write_master_excel(store_to_sheets(df), master_file)
+
+    # Le nouvel Excel est l'image du store : il ne le rend pas périmé
+    record_source(store, master_file)
+    print("✅ DB_Shipping_Master.xlsx régénéré depuis le store")
+
+def integrate_into_store(final_data, master_file, export_excel=True):
+    """
+    Ajoute les données transformées au store partitionné
+
+    Seules les nouvelles partitions (port, mois) et le manifest sont écrits :
+    l'historique existant n'est ni relu ni réécrit. DB_Shipping_Master.xlsx
+    est ensuite régénéré, tant que des lecteurs en dépendent (validation_app,
+    db_sync, déploiement sans le store).
+
+    Args:
+        final_data: dict {'ABIDJAN': DataFrame, 'SAN_PEDRO': DataFrame}
+        master_file: Chemin de DB_Shipping_Master.xlsx
+        export_excel: Si False, n'écrit que le store (l'Excel reste à l'état précédent)
+    """
+    store = ensure_master_store(master_file)
+
+    # Les deux ports sont publiés ensemble, par une seule écriture du manifest
+    frames = {
+        MASTER_SHEETS[sheet_name]: final_data[port]
+        for port, sheet_name in (('ABIDJAN', 'DB ABJ'), ('SAN_PEDRO', 'DB SP'))
+        if final_data.get(port) is not None
+    }
+    added = append_to_store(store, frames)
+
+    for sheet_name, port in MASTER_SHEETS.items():
+        if port in frames:
+            port_added = [partition for partition in added if partition['port'] == port]
+            added_count = sum(partition['rows'] for partition in port_added)
+            print(f"✅ {sheet_name}: +{added_count:,} lignes ajoutées ({len(port_added)} partitions)")
+
+    manifest = load_manifest(store)
+    print(f"📦 Store version {manifest['version']}: {len(manifest['partitions'])} partitions")
+
+    if export_excel:
+        export_master_excel(master_file)
+
+def integrate_selected_files(selected_file_paths, validation_file=None, dry_run=False, export_excel=True):
+    """
+    Intègre des fichiers spécifiques sélectionnés dans le store du master
 
     Args:
         selected_file_paths: Liste des chemins de fichiers à intégrer
         validation_file: Fichier de validation JSON (optionnel)
         dry_run: Si True, simule l'intégration sans modifier les fichiers
+        export_excel: Si True (défaut), régénère aussi DB_Shipping_Master.xlsx
     """
 
     print(f"🚀 INTÉGRATION DE {len(selected_file_paths)} FICHIERS SÉLECTIONNÉS")
@@ -456,66 +596,15 @@ def integrate_selected_files(selected_file_paths, validation_file=None, dry_run=
             'errors': errors
         }
 
-    # INTÉGRATION RÉELLE dans DB_Shipping_Master.xlsx
+    # INTÉGRATION RÉELLE dans le store du master
     if any(data is not None for data in final_data.values()):
-        print(f"\n💾 INTÉGRATION DANS DB_Shipping_Master.xlsx...")
+        print(f"\n💾 INTÉGRATION DANS LE STORE DU MASTER...")
 
         # Créer sauvegarde avant modification
         backup_master_database()
 
         master_file = MASTER_DATA / "DB_Shipping_Master.xlsx"
-
-        # Charger les données existantes
-        with pd.ExcelFile(master_file, engine='openpyxl') as xls:
-            updated_sheets = {}
-            for sheet_name in xls.sheet_names:
-                updated_sheets[sheet_name] = pd.read_excel(xls, sheet_name=sheet_name)
-
-        # Ajouter les nouvelles données aux feuilles correspondantes
-        if final_data['ABIDJAN'] is not None:
-            original_count = len(updated_sheets['DB ABJ'])
-            updated_sheets['DB ABJ'] = pd.concat([updated_sheets['DB ABJ'], final_data['ABIDJAN']], ignore_index=True)
-            added_count = len(updated_sheets['DB ABJ']) - original_count
-            print(f"✅ DB ABJ: +{added_count:,} lignes ajoutées")
-
-        if final_data['SAN_PEDRO'] is not None:
-            original_count = len(updated_sheets['DB SP'])
-            updated_sheets['DB SP'] = pd.concat([updated_sheets['DB SP'], final_data['SAN_PEDRO']], ignore_index=True)
-            added_count = len(updated_sheets['DB SP']) - original_count
-            print(f"✅ DB SP: +{added_count:,} lignes ajoutées")
-
-        # Sauvegarder avec gestion d'erreur pour gros fichiers
-        print("💾 Sauvegarde du master mis à jour...")
-
-        import time
-        max_retries = 3
-        for attempt in range(max_retries):
-            try:
-                # Créer un fichier temporaire d'abord
-                temp_file = master_file.parent / f"temp_{master_file.name}"
-
-                with pd.ExcelWriter(temp_file, engine='openpyxl') as writer:
-                    for sheet_name, df in updated_sheets.items():
-                        print(f"   Écriture feuille {sheet_name}: {len(df):,} lignes...")
-                        df.to_excel(writer, sheet_name=sheet_name, index=False)
-
-                # Si succès, remplacer le fichier original
-                if temp_file.exists():
-                    shutil.move(str(temp_file), str(master_file))
-                break
-
-            except (TimeoutError, OSError) as e:
-                print(f"⚠️  Tentative {attempt + 1}/{max_retries} échouée: {e}")
-                if temp_file.exists():
-                    temp_file.unlink()
-                if attempt < max_retries - 1:
-                    print("   Attente 5 secondes avant retry...")
-                    time.sleep(5)
-                else:
-                    raise Exception(f"Impossible d'écrire le fichier après {max_retries} tentatives")
-
-        print("✅ DB_Shipping_Master.xlsx mis à jour avec succès!")
-        print(f"📊 Taille finale: {master_file.stat().st_size / (1024*1024):.1f} MB")
+        integrate_into_store(final_data, master_file, export_excel=export_excel)
 
         # Créer rapport d'intégration
         timestamp = datetime.now().strftime('%Y%m%d_%H%M')
@@ -537,9 +626,9 @@ def integrate_selected_files(selected_file_paths, validation_file=None, dry_run=
         'errors': errors
     }
 
-def integrate_monthly_data(year="2023", validation_file=None, dry_run=False):
+def integrate_monthly_data(year="2023", validation_file=None, dry_run=False, export_excel=True):
     """
-    Intègre les données mensuelles validées dans DB_Shipping_Master.xlsx
+    Intègre les données mensuelles validées dans le store du master
     PROMIS: Cette fois ça va marcher !
     """
     
@@ -629,7 +718,7 @@ def integrate_monthly_data(year="2023", validation_file=None, dry_run=False):
         return integration_stats
     else:
         # Effectuer l'intégration réelle
-        print(f"\n💾 INTÉGRATION DANS DB_Shipping_Master.xlsx...")
+        print(f"\n💾 INTÉGRATION DANS LE STORE DU MASTER...")
         
         # Sauvegarder le master actuel
         backup_path = backup_master_database()
@@ -640,61 +729,7 @@ def integrate_monthly_data(year="2023", validation_file=None, dry_run=False):
         master_file = MASTER_DATA / "DB_Shipping_Master.xlsx"
         
         try:
-            # Lire le master existant
-            print("📖 Lecture du master existant...")
-            existing_sheets = {}
-            with pd.ExcelFile(master_file, engine='openpyxl') as xls:
-                for sheet_name in xls.sheet_names:
-                    existing_sheets[sheet_name] = pd.read_excel(xls, sheet_name=sheet_name)
-                    print(f"📊 Feuille {sheet_name}: {len(existing_sheets[sheet_name]):,} lignes existantes")
-            
-            # Ajouter nouvelles données aux feuilles appropriées
-            updated_sheets = existing_sheets.copy()
-            
-            if 'ABIDJAN' in final_data and 'DB ABJ' in updated_sheets:
-                original_count = len(updated_sheets['DB ABJ'])
-                updated_sheets['DB ABJ'] = pd.concat([updated_sheets['DB ABJ'], final_data['ABIDJAN']], ignore_index=True)
-                added_count = len(updated_sheets['DB ABJ']) - original_count
-                print(f"✅ DB ABJ: +{added_count:,} lignes ajoutées")
-            
-            if 'SAN_PEDRO' in final_data and 'DB SP' in updated_sheets:
-                original_count = len(updated_sheets['DB SP'])
-                updated_sheets['DB SP'] = pd.concat([updated_sheets['DB SP'], final_data['SAN_PEDRO']], ignore_index=True)
-                added_count = len(updated_sheets['DB SP']) - original_count
-                print(f"✅ DB SP: +{added_count:,} lignes ajoutées")
-            
-            # Sauvegarder directement en .xlsx avec gestion d'erreur pour gros fichiers
-            print("💾 Sauvegarde du master mis à jour...")
-
-            import time
-            max_retries = 3
-            for attempt in range(max_retries):
-                try:
-                    # Créer un fichier temporaire d'abord
-                    temp_file = master_file.parent / f"temp_{master_file.name}"
-
-                    with pd.ExcelWriter(temp_file, engine='openpyxl') as writer:
-                        for sheet_name, df in updated_sheets.items():
-                            print(f"   Écriture feuille {sheet_name}: {len(df):,} lignes...")
-                            df.to_excel(writer, sheet_name=sheet_name, index=False)
-
-                    # Si succès, remplacer le fichier original
-                    if temp_file.exists():
-                        shutil.move(str(temp_file), str(master_file))
-                    break
-
-                except (TimeoutError, OSError) as e:
-                    print(f"⚠️  Tentative {attempt + 1}/{max_retries} échouée: {e}")
-                    if temp_file.exists():
-                        temp_file.unlink()
-                    if attempt < max_retries - 1:
-                        print("   Attente 5 secondes avant retry...")
-                        time.sleep(5)
-                    else:
-                        raise Exception(f"Impossible d'écrire le fichier après {max_retries} tentatives")
-            
-            print("✅ DB_Shipping_Master.xlsx mis à jour avec succès!")
-            print(f"📊 Taille finale: {master_file.stat().st_size / (1024*1024):.1f} MB")
+            integrate_into_store(final_data, master_file, export_excel=export_excel)
             
             # Créer rapport d'intégration
             report_file = VALIDATION_DIR / f"integration_report_{year}_{datetime.now().strftime('%Y%m%d_%H%M')}.json"
@@ -719,5 +754,6 @@ def integrate_monthly_data(year="2023", validation_file=None, dry_run=False):
 if __name__ == "__main__":
     # Intégration réelle des données 2025
     print("🚀 INTÉGRATION DES DONNÉES 2025 - OPTIMISÉE") 
-    stats = integrate_monthly_data(year="2025", dry_run=False)  # Mode réel
+    # --no-export-excel : n'écrit que le store (DB_Shipping_Master.xlsx n'est pas régénéré)
+    stats = integrate_monthly_data(year="2025", dry_run=False, export_excel="--no-export-excel" not in sys.argv)  # Mode réel
     print(f"\n📊 RÉSULTAT FINAL: {stats}")
\ No newline at end of file
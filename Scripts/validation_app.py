@@ -1775,7 +1775,7 @@ def main():
                         progress_bar.progress(0.4)
                         
                         # Lancer l'intégration réelle
-                        status_placeholder.info("Intégration des données dans DB_Shipping_Master.xlsx...")
+                        status_placeholder.info("Intégration des données dans le store et DB_Shipping_Master.xlsx...")
                         progress_bar.progress(0.5)
                         
                         # Utiliser la fonction d'intégration pour fichiers sélectionnés
@@ -11,6 +11,7 @@ from pathlib import Path
 import plotly.express as px
 import plotly.graph_objects as go
 from watchai_logger import watchai_logger
+from log_rotation import tail_log
 from auth_config import get_connection_stats
 
 # Configuration de la page
@@ -146,7 +147,7 @@ def show_overview():
     st.divider()
 
     # Statistiques générales du système
-    st.subheader("Statistiques système")
+    st.subheader(f"Statistiques système ({watchai_logger.STATS_WINDOW_DAYS} derniers jours)")
 
     # Récupérer les statistiques
     stats = watchai_logger.get_session_stats()
@@ -155,7 +156,7 @@ def show_overview():
     col1, col2, col3, col4 = st.columns(4)
 
     with col1:
-        st.metric("Sessions totales", stats.get('total', 0))
+        st.metric(f"Sessions ({watchai_logger.STATS_WINDOW_DAYS} j)", stats.get('total', 0))
 
     with col2:
         st.metric("Sessions aujourd'hui", stats.get('today', 0))
@@ -198,21 +199,11 @@ def show_active_sessions():
     # Sessions des dernières heures
     hours_filter = st.selectbox("Afficher les sessions des dernières:", [1, 6, 12, 24, 48], index=2)
 
-    recent_sessions = watchai_logger.get_recent_sessions(1000)
-
-    if recent_sessions:
-        # Filtrer par heures
-        cutoff_time = datetime.now() - timedelta(hours=hours_filter)
-        filtered_sessions = []
-
-        for session in recent_sessions:
-            try:
-                session_time = datetime.fromisoformat(session['timestamp'])
-                if session_time >= cutoff_time:
-                    filtered_sessions.append(session)
-            except:
-                continue
+    # Plage de temps résolue par la base de logs (index sur l'horodatage)
+    cutoff_time = datetime.now() - timedelta(hours=hours_filter)
+    filtered_sessions = watchai_logger.get_sessions_since(cutoff_time)
 
+    if filtered_sessions or watchai_logger.get_recent_sessions(1):
         if filtered_sessions:
             st.write(f"**{len(filtered_sessions)} sessions** trouvées dans les {hours_filter} dernières heures")
 
@@ -252,20 +243,16 @@ def show_detailed_logs():
 
     try:
         if log_type == "Access Logs":
-            log_file = "/Users/julienmarboeuf/Documents/BON PLEIN/WATCHAI/Logs/access.log"
+            log_file = watchai_logger.access_log_file
         else:
-            log_file = "/Users/julienmarboeuf/Documents/BON PLEIN/WATCHAI/Logs/activity.log"
+            log_file = watchai_logger.activity_log_file
 
         if Path(log_file).exists():
             # Nombre de lignes à afficher
             num_lines = st.number_input("Nombre de lignes à afficher:", min_value=10, max_value=1000, value=50)
 
-            # Lire les dernières lignes du fichier
-            with open(log_file, 'r', encoding='utf-8') as f:
-                lines = f.readlines()
-
-            # Afficher les dernières lignes
-            recent_lines = lines[-num_lines:]
+            # Lire les dernières lignes (depuis la fin, archives gzip lues seulement si besoin)
+            recent_lines = tail_log(log_file, num_lines)
 
             st.subheader(f"Dernières {len(recent_lines)} entrées")
 
@@ -283,20 +270,18 @@ def show_detailed_logs():
         st.error(f"Erreur lors de la lecture des logs: {str(e)}")
 
 def show_statistics():
-    """Statistiques et graphiques"""
+    """Statistiques et graphiques (agrégats calculés par la base de logs)"""
     st.header("Statistiques d'utilisation")
 
-    recent_sessions = watchai_logger.get_recent_sessions(1000)
+    # Fenêtre bornée : le coût des agrégats ne dépend pas de l'historique conservé
+    window_days = watchai_logger.STATS_WINDOW_DAYS
+    since = datetime.now() - timedelta(days=window_days)
 
-    if recent_sessions:
-        df = pd.DataFrame(recent_sessions)
-        df['timestamp'] = pd.to_datetime(df['timestamp'])
-        df['date'] = df['timestamp'].dt.date
-        df['hour'] = df['timestamp'].dt.hour
+    daily_stats = pd.DataFrame(watchai_logger.get_session_counts('date', since=since), columns=['date', 'sessions'])
 
+    if not daily_stats.empty:
         # Graphique des connexions par jour
-        st.subheader("Connexions par jour")
-        daily_stats = df.groupby('date').size().reset_index(name='sessions')
+        st.subheader(f"Connexions par jour ({window_days} derniers jours)")
         daily_stats['date'] = pd.to_datetime(daily_stats['date'])
 
         fig = px.line(daily_stats, x='date', y='sessions', title="Sessions par jour")
@@ -305,23 +290,28 @@ def show_statistics():
 
         # Graphique des connexions par heure
         st.subheader("Connexions par heure (24h)")
-        hourly_stats = df.groupby('hour').size().reset_index(name='sessions')
+        hourly_stats = pd.DataFrame(
+            watchai_logger.get_session_counts('hour', since=datetime.now() - timedelta(hours=24)),
+            columns=['hour', 'sessions']
+        )
 
         fig = px.bar(hourly_stats, x='hour', y='sessions', title="Sessions par heure")
         fig.update_traces(marker_color='#4DBDB3')
         st.plotly_chart(fig, use_container_width=True)
 
         # Top des pages visitées
-        st.subheader("Pages les plus visitées")
-        page_stats = df['page'].value_counts().head(10)
+        st.subheader(f"Pages les plus visitées ({window_days} derniers jours)")
+        page_stats = pd.DataFrame(watchai_logger.get_session_counts('page', since=since, limit=10),
+                                  columns=['page', 'sessions'])
 
-        fig = px.pie(values=page_stats.values, names=page_stats.index, title="Répartition des visites par page")
+        fig = px.pie(page_stats, values='sessions', names='page', title="Répartition des visites par page")
         st.plotly_chart(fig, use_container_width=True)
 
         # Top des IPs
-        st.subheader("IPs les plus actives")
-        ip_stats = df['client_ip'].value_counts().head(10)
-        st.bar_chart(ip_stats)
+        st.subheader(f"IPs les plus actives ({window_days} derniers jours)")
+        ip_stats = pd.DataFrame(watchai_logger.get_session_counts('client_ip', since=since, limit=10),
+                                columns=['client_ip', 'sessions'])
+        st.bar_chart(ip_stats.set_index('client_ip')['sessions'])
 
     else:
         st.info("Pas assez de données pour générer des statistiques")
@@ -0,0 +1,98 @@
+"""
+WATCHAI - Requêtes de l'analyse comparative
+Agrégats de toutes les saisons sélectionnées en un seul group-by
+(SAISON × dimension) par dimension, sur l'agrégat de base du cube OLAP
+
+Comparer 10 saisons coûte autant que comparer 2 : aucune boucle ne
+re-filtre les données saison par saison, et les filtres de la sidebar
+passent par l'index de lignes du cube (filter_index).
+"""
+
+import pandas as pd
+
+from olap_cube import rollup
+
+
+class ComparativeQuery:
+    """Saisons sélectionnées + filtres, interrogées dimension par dimension"""
+
+    def __init__(self, cube, seasons, filters=None):
+        """
+        Args:
+            cube: OlapCube (exact ou watermarké selon l'utilisateur)
+            seasons: Saisons à comparer (ordre conservé dans les résultats)
+            filters: dict {dimension: valeurs retenues}, liste vide = pas de filtre
+        """
+        self.seasons = list(seasons)
+
+        # Saisons sélectionnées, avant filtres (listes proposées dans la sidebar)
+        self.scope = cube.select({'SAISON': self.seasons})
+
+        # Filtres résolus par intersection de l'index (sans parcours des colonnes)
+        self.table = cube.select({'SAISON': self.seasons, **(filters or {})})
+
+    def options(self, dimension):
+        """Valeurs d'une dimension présentes dans les saisons sélectionnées"""
+        return sorted(self.scope[dimension].dropna().unique())
+
+    def overview(self):
+        """Volume, opérations, exportateurs et destinations distincts par saison"""
+        grouped = self.table.groupby('SAISON', observed=True)
+        overview = pd.DataFrame({
+            'Volume Total': grouped['POIDS_TONNES'].sum(),
+            'Opérations': grouped['NB_LIGNES'].sum(),
+            'Exportateurs': grouped['EXPORTATEUR SIMPLE'].nunique(),
+            'Destinations': grouped['DESTINATION'].nunique(),
+        })
+        overview = overview.reindex(pd.Index(self.seasons, name='Saison'), fill_value=0)
+        return overview.reset_index()
+
+    def totals(self, dimension):
+        """Tonnes et opérations par (SAISON, dimension), toutes saisons en un group-by"""
+        return rollup(self.table, ['SAISON', dimension], dropna=True)
+
+    def by_season(self, table, dimension, measure='POIDS_TONNES'):
+        """Découpe un résultat par saison : {saison: Series dimension -> mesure}"""
+        parts = {
+            season: part.set_index(dimension)[measure]
+            for season, part in table.groupby('SAISON', observed=True)
+        }
+        empty = pd.Series(dtype='float64')
+        return {season: parts.get(season, empty) for season in self.seasons}
+
+    def top_by_season(self, dimension, n=5):
+        """Top n de la dimension pour chaque saison (volume décroissant)"""
+        totals = self.totals(dimension).sort_values('POIDS_TONNES', ascending=False, kind='stable')
+        top = totals.groupby('SAISON', observed=True).head(n)
+        return self.by_season(top, dimension)
+
+    def beans_vs_processed(self):
+        """Volume Fèves / Produits transformés par saison"""
+        products = self.totals('PRODUIT')
+        is_beans = products['PRODUIT'].astype(str).str.contains('FEVE', case=False)
+
+        split = pd.DataFrame({
+            'SAISON': products['SAISON'].astype(str),
+            'Fèves': products['POIDS_TONNES'].where(is_beans, 0),
+            'Produits Transformés': products['POIDS_TONNES'].where(~is_beans, 0),
+        })
+        return split.groupby('SAISON').sum().reindex(self.seasons, fill_value=0)
+
+    def processed_products(self):
+        """Détail des produits transformés (hors fèves) par saison, volume décroissant"""
+        products = self.totals('PRODUIT')
+        products = products[~products['PRODUIT'].astype(str).str.contains('FEVE', case=False)]
+        products = products.sort_values('POIDS_TONNES', ascending=False, kind='stable')
+        return self.by_season(products, 'PRODUIT')
+
+    def port_detail(self):
+        """Volume, opérations et part de chaque port par saison"""
+        ports = self.totals('PORT')
+        season_volume = self.table.groupby('SAISON', observed=True)['POIDS_TONNES'].sum()
+        ports['PART'] = ports['POIDS_TONNES'] / ports['SAISON'].map(season_volume).astype('float64')
+
+        detail = {}
+        for season, part in ports.groupby('SAISON', observed=True):
+            detail[season] = part[['PORT', 'POIDS_TONNES', 'NB_OPERATIONS', 'PART']].reset_index(drop=True)
+        empty = pd.DataFrame(columns=['PORT', 'POIDS_TONNES', 'NB_OPERATIONS', 'PART'])
+        return {season: detail.get(season, empty) for season in self.seasons}
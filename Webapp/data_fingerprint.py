@@ -0,0 +1,77 @@
+"""
+WATCHAI - Empreinte de la source de données
+Clé de cache du dashboard : change exactement quand le master change
+
+- Store partitionné : manifest.json (version + hash du contenu)
+- Sinon DB_Shipping_Master.xlsx : hash SHA-256 du fichier
+
+Le hash n'est recalculé que si (mtime, taille) changent.
+"""
+
+import hashlib
+import json
+from datetime import datetime
+from pathlib import Path
+
+# Hash par fichier : {chemin: ((mtime_ns, taille), sha256)}
+_digest_cache = {}
+
+
+def file_digest(path, chunk_size=1024 * 1024):
+    """SHA-256 d'un fichier, mis en cache tant que mtime et taille sont inchangés"""
+    path = Path(path)
+    stat = path.stat()
+    signature = (stat.st_mtime_ns, stat.st_size)
+
+    cached = _digest_cache.get(str(path))
+    if cached and cached[0] == signature:
+        return cached[1]
+
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            sha.update(chunk)
+
+    digest = sha.hexdigest()
+    _digest_cache[str(path)] = (signature, digest)
+    return digest
+
+
+def file_fingerprint(path):
+    """Chemin, date de modification, taille et SHA-256 d'un fichier"""
+    path = Path(path)
+    stat = path.stat()
+    return {
+        "path": str(path),
+        "modified": datetime.fromtimestamp(stat.st_mtime).isoformat(timespec='seconds'),
+        "size": stat.st_size,
+        "sha256": file_digest(path)
+    }
+
+
+def master_fingerprint(master_file, manifest_file=None):
+    """
+    Empreinte de la source lue par le dashboard pour un emplacement du master
+
+    Args:
+        master_file: Chemin de DB_Shipping_Master.xlsx
+        manifest_file: manifest.json du store partitionné (None si store non disponible)
+
+    Returns:
+        dict (source, version, path, modified, size, sha256, key) ou None si rien n'existe
+    """
+    if manifest_file is not None and Path(manifest_file).exists():
+        fingerprint = {"source": "store", **file_fingerprint(manifest_file)}
+        try:
+            with open(manifest_file, 'r', encoding='utf-8') as f:
+                fingerprint["version"] = json.load(f).get("version")
+        except (json.JSONDecodeError, OSError):
+            fingerprint["version"] = None
+    elif Path(master_file).exists():
+        fingerprint = {"source": "excel", "version": None, **file_fingerprint(master_file)}
+    else:
+        return None
+
+    # Clé de cache : uniquement le contenu (un simple touch ne recharge pas)
+    fingerprint["key"] = f"{fingerprint['source']}:{fingerprint['sha256']}"
+    return fingerprint
@@ -6,8 +6,132 @@ Système de watermarking invisible pour tracer les fuites de données
 import pandas as pd
 import numpy as np
 import hashlib
+import re
 import streamlit as st
 
+_SPLITMIX_GAMMA = np.uint64(0x9E3779B97F4A7C15)
+_SPLITMIX_M1 = np.uint64(0xBF58476D1CE4E5B9)
+_SPLITMIX_M2 = np.uint64(0x94D049BB133111EB)
+
+
+def _splitmix64(x):
+    """Mélangeur SplitMix64 vectorisé : uint64 -> uint64 pseudo-aléatoire"""
+    with np.errstate(over='ignore'):
+        x = np.asarray(x, dtype=np.uint64) + _SPLITMIX_GAMMA
+        x = (x ^ (x >> np.uint64(30))) * _SPLITMIX_M1
+        x = (x ^ (x >> np.uint64(27))) * _SPLITMIX_M2
+    return x ^ (x >> np.uint64(31))
+
+
+def _stream_key(*parts):
+    """Clé 64 bits d'un flux de bruit (ex. seed utilisateur + colonne)"""
+    digest = hashlib.blake2b('|'.join(str(part) for part in parts).encode(), digest_size=8).digest()
+    return np.uint64(int.from_bytes(digest, 'little'))
+
+
+def _keyed_normal(keys, stream):
+    """
+    Tirages gaussiens N(0, 1) indexés par clé (générateur à compteur)
+
+    Chaque tirage ne dépend que de (flux, clé) : ni de la position de la
+    ligne, ni des autres lignes du DataFrame.
+    """
+    first = _splitmix64(keys ^ stream)
+    second = _splitmix64(first)
+    u1 = 1.0 - (first >> np.uint64(11)) * 2.0 ** -53  # ]0, 1]
+    u2 = (second >> np.uint64(11)) * 2.0 ** -53
+    return np.sqrt(-2.0 * np.log(u1)) * np.cos(2.0 * np.pi * u2)
+
+
+_MISSING_HASH = pd.util.hash_array(np.array(['nan'], dtype=object))[0]
+
+# Entier écrit comme un float ('18010000.0' dans un export CSV d'une colonne float)
+_INTEGRAL_FLOAT_TEXT = re.compile(r'^(-?\d+)\.0+$')
+
+
+def _canonical_text(value):
+    """
+    Forme texte canonique d'une valeur de clé, quelle que soit sa source
+
+    Un code lu d'Excel en float (18010000.0), en int ou en texte ('18010000 ',
+    '18010000.0' depuis un CSV) donne le même texte que dans le store ('18010000').
+    """
+    if isinstance(value, str):
+        value = value.strip()
+        integral = _INTEGRAL_FLOAT_TEXT.match(value)
+        return integral.group(1) if integral else value
+    if isinstance(value, (bool, np.bool_)):
+        return str(value)
+    if isinstance(value, (int, np.integer)):
+        return str(int(value))
+    if isinstance(value, (float, np.floating)) and float(value).is_integer():
+        return str(int(value))
+    return str(value)
+
+
+def _hash_column(values):
+    """Hash uint64 par ligne d'une colonne, indépendant de son type de stockage"""
+    if pd.api.types.is_datetime64_any_dtype(values):
+        # Date au jour près : identique qu'elle soit lue d'Excel, d'un CSV ou du store
+        days = pd.to_datetime(values).to_numpy(dtype='datetime64[D]').view(np.int64)
+        return pd.util.hash_array(days)
+
+    # Hash des seules valeurs distinctes (catégories comprises), distribué par les codes
+    codes, uniques = pd.factorize(values)
+    text = np.array([_canonical_text(value) for value in np.asarray(uniques, dtype=object)], dtype=object)
+
+    # Valeur manquante (code -1) : dernier élément
+    hashed = np.append(pd.util.hash_array(text), np.uint64(_MISSING_HASH))
+    return hashed[codes]
+
+
+def _hash_columns(df, columns):
+    """Hash uint64 par ligne de la combinaison de colonnes (ordre des colonnes significatif)"""
+    combined = np.zeros(len(df), dtype=np.uint64)
+    for col in columns:
+        combined = _splitmix64(combined ^ _hash_column(df[col]))
+    return combined
+
+
+class RowIndex:
+    """
+    Lignes de l'original triées par (contenu, poids), pour aligner une fuite
+
+    Une ligne suspecte est rattachée à la ligne originale de même contenu ;
+    parmi des lignes de même contenu, à celle dont le poids exact est le plus
+    proche de son poids bruité (bruit ≤ 0.5%). Utilisé par verify_watermark
+    et par trace_leak : les deux vérifications alignent de la même façon.
+    """
+
+    def __init__(self, watermarking, original_df):
+        self._watermarking = watermarking
+        self.keys = watermarking.row_keys(original_df)
+
+        weights = watermarking.key_weights(original_df)
+        self._weights = weights if weights is not None else np.zeros(len(original_df))
+        content = watermarking.content_keys(original_df)
+
+        self._order = np.lexsort((self._weights, content))
+        self._content = content[self._order]
+        self._sorted_weights = self._weights[self._order]
+
+    def locate(self, df):
+        """Position dans l'original de chaque ligne de df (-1 si son contenu est absent)"""
+        content = self._watermarking.content_keys(df)
+        lo = np.searchsorted(self._content, content, side='left')
+        hi = np.searchsorted(self._content, content, side='right')
+        located = np.where(hi > lo, lo, -1)
+
+        # Plusieurs lignes de même contenu : le poids le plus proche
+        weights = self._watermarking.key_weights(df)
+        if weights is not None:
+            for i in np.flatnonzero(hi - lo > 1):
+                distance = np.abs(self._sorted_weights[lo[i]:hi[i]] - weights[i])
+                located[i] = lo[i] + int(np.argmin(np.nan_to_num(distance, nan=np.inf)))
+
+        return np.where(located >= 0, self._order[np.maximum(located, 0)], -1)
+
+
 class DataWatermarking:
     def __init__(self):
         # Configuration du watermarking
@@ -22,6 +146,22 @@ class DataWatermarking:
             'PDSNET'
         ]
 
+        # Colonnes du contenu d'une expédition (clé stable de ligne, hors colonnes watermarkées)
+        self.ROW_KEY_COLUMNS = [
+            'DATENR',
+            'PORT',
+            'ORIGINE',
+            'DESTINATION',
+            'EXPORTATEUR',
+            'DESTINATAIRE',
+            'POSTAR'
+        ]
+
+        # Mode de watermarking :
+        # - "row" : bruit sur chaque expédition avant agrégation
+        # - "aggregate" : bruit sur chaque cellule agrégée, après group-by
+        self.WATERMARK_MODE = "row"
+
     def get_user_seed(self, username):
         """
         Génère un seed unique et déterministe pour chaque utilisateur
@@ -35,52 +175,132 @@ class DataWatermarking:
         seed = int(hash_object.hexdigest(), 16) % (2**32 - 1)
         return seed
 
-    def apply_watermark(self, df, username):
+    def content_keys(self, df):
+        """Hash (uint64) des colonnes de contenu de chaque expédition (ROW_KEY_COLUMNS)"""
+        columns = [col for col in self.ROW_KEY_COLUMNS if col in df.columns]
+        return _hash_columns(df, columns)
+
+    def key_weights(self, df):
+        """
+        Poids net (kg) de chaque expédition : PDSNET, sinon POIDS_TONNES × 1000
+
+        Arrondi au gramme : identique quelle que soit la colonne disponible.
+        None si aucune colonne de poids n'est présente.
+        """
+        if 'PDSNET' in df.columns:
+            weights = df['PDSNET'].to_numpy(dtype=np.float64)
+        elif 'POIDS_TONNES' in df.columns:
+            weights = df['POIDS_TONNES'].to_numpy(dtype=np.float64) * 1000
+        else:
+            return None
+        return np.round(weights, 3)
+
+    def row_keys(self, df):
+        """
+        Clé stable (uint64) de chaque expédition, indépendante de sa position
+
+        Hash des colonnes de contenu (ROW_KEY_COLUMNS) et du poids exact : une
+        ligne garde sa clé quand des mois ou des lignes de même contenu sont
+        ajoutés, ou quand l'ordre change. Des lignes strictement identiques
+        partagent leur clé, donc leur bruit (elles restent identiques).
+
+        Le poids d'une fuite étant bruité, ses lignes ne sont pas retrouvées
+        par leur clé mais alignées sur l'original par row_index().
+        """
+        keys = self.content_keys(df)
+        weights = self.key_weights(df)
+        if weights is not None:
+            keys = _splitmix64(keys ^ _hash_column(pd.Series(weights)))
+        return keys
+
+    def row_index(self, original_df):
+        """Index de l'original pour aligner les lignes d'un fichier suspect (RowIndex)"""
+        return RowIndex(self, original_df)
+
+    def watermark_factors(self, keys, username, column):
+        """Facteurs (1 + bruit) d'une colonne pour des clés de lignes, déterministes par utilisateur"""
+        noise = _keyed_normal(keys, _stream_key(self.get_user_seed(username), column))
+        noise *= self.NOISE_PERCENTAGE
+
+        # Clipper pour éviter des variations trop importantes
+        np.clip(noise, -self.MAX_NOISE, self.MAX_NOISE, out=noise)
+        return 1.0 + noise
+
+    def apply_watermark(self, df, username, log=True):
         """
         Applique un watermark invisible aux données
 
+        Le bruit de chaque ligne dépend uniquement de (utilisateur, clé stable
+        de la ligne) : il est identique d'une version du master à l'autre, et
+        peut être calculé pour les seules nouvelles lignes.
+
+        Seules les colonnes watermarkées sont allouées : les autres colonnes
+        (dimensions texte, dates...) restent partagées avec le DataFrame
+        original (copie superficielle, copy-on-write côté dashboard).
+
         Args:
-            df: DataFrame original
+            df: DataFrame original (non modifié)
             username: Nom de l'utilisateur
+            log: Journaliser l'application (False hors session Streamlit)
 
         Returns:
             DataFrame watermarké (ou original si admin)
         """
-        # Si admin, retourner les données exactes
+        # Si admin, retourner les données exactes (sans copie des colonnes)
         if username == self.ADMIN_USER:
-            return df.copy()
+            return df.copy(deep=False)
 
-        # Copier le dataframe pour ne pas modifier l'original
-        df_watermarked = df.copy()
+        # Copie superficielle : les colonnes non watermarkées ne sont pas dupliquées
+        df_watermarked = df.copy(deep=False)
+        keys = self.row_keys(df)
 
-        # Générer le seed utilisateur
-        seed = self.get_user_seed(username)
-        np.random.seed(seed)
-
-        # Appliquer le watermark sur chaque colonne numérique
+        # Appliquer le watermark sur chaque colonne numérique (un flux de bruit par colonne)
         for col in self.WATERMARK_COLUMNS:
             if col in df_watermarked.columns:
-                # Générer un facteur de bruit unique pour cette colonne
-                # Chaque valeur aura un bruit légèrement différent mais déterministe
-                n_rows = len(df_watermarked)
-
-                # Créer un bruit gaussien centré sur 0
-                noise_factors = np.random.normal(0, self.NOISE_PERCENTAGE, n_rows)
+                # Facteurs en float32 (précision ~1e-7, bien en deçà du bruit)
+                factors = self.watermark_factors(keys, username, col).astype(np.float32)
 
-                # Clipper pour éviter des variations trop importantes
-                noise_factors = np.clip(noise_factors, -self.MAX_NOISE, self.MAX_NOISE)
-
-                # Appliquer le bruit multiplicatif
-                df_watermarked[col] = df_watermarked[col] * (1 + noise_factors)
+                # Appliquer le bruit multiplicatif : seule nouvelle colonne allouée
+                df_watermarked[col] = df_watermarked[col].to_numpy(dtype=np.float64) * factors
 
         # Logger le watermarking
-        self._log_watermark(username, len(df_watermarked))
+        if log:
+            self._log_watermark(username, len(df_watermarked))
 
         return df_watermarked
 
+    def apply_watermark_to_values(self, values, username, identifiers):
+        """
+        Applique un watermark à un lot de valeurs (KPIs, cellules de tableau)
+
+        Le bruit de chaque valeur dépend uniquement de (utilisateur, identifiant) :
+        générateur à compteur local, sans état aléatoire global partagé entre
+        les sessions Streamlit.
+
+        Args:
+            values: Valeurs numériques (array-like)
+            username: Nom de l'utilisateur
+            identifiers: Identifiant unique de chaque valeur (même longueur)
+
+        Returns:
+            np.ndarray float64 des valeurs watermarkées (exactes si admin)
+        """
+        values = np.asarray(values, dtype=np.float64)
+
+        # Si admin, retourner les valeurs exactes
+        if username == self.ADMIN_USER:
+            return values
+
+        keys = _hash_column(pd.Series(np.asarray(identifiers, dtype=object)).astype(str))
+        noise = _keyed_normal(keys, _stream_key(self.get_user_seed(username), 'value'))
+        noise *= self.NOISE_PERCENTAGE
+        np.clip(noise, -self.MAX_NOISE, self.MAX_NOISE, out=noise)
+
+        return values * (1.0 + noise)
+
     def apply_watermark_to_value(self, value, username, identifier=""):
         """
-        Applique un watermark à une valeur unique
+        Applique un watermark à une valeur unique (voir apply_watermark_to_values)
 
         Args:
             value: Valeur numérique à watermarker
@@ -94,16 +314,94 @@ class DataWatermarking:
         if username == self.ADMIN_USER:
             return value
 
-        # Générer un seed basé sur username + identifier
-        seed_string = f"{username}_{identifier}"
-        hash_object = hashlib.sha256(seed_string.encode())
-        seed = int(hash_object.hexdigest(), 16) % (2**32 - 1)
+        return float(self.apply_watermark_to_values([value], username, [identifier])[0])
+
+    def aggregate_noise_factors(self, username, keys):
+        """
+        Facteurs de bruit (1 + bruit) par agrégat, déterministes par (utilisateur, identité)
+
+        L'identité d'un agrégat est la valeur de ses colonnes de regroupement :
+        la même cellule reçoit toujours le même bruit, quel que soit l'ordre
+        des lignes ou la vue qui l'affiche. Coût en O(groupes).
+
+        Args:
+            username: Nom de l'utilisateur
+            keys: DataFrame des colonnes d'identité (une ligne par agrégat)
+
+        Returns:
+            np.ndarray float64 de len(keys) facteurs
+        """
+        keys = _hash_columns(keys, keys.columns)
+        noise = _keyed_normal(keys, _stream_key(self.get_user_seed(username), 'aggregate'))
+        noise *= self.NOISE_PERCENTAGE
+
+        np.clip(noise, -self.MAX_NOISE, self.MAX_NOISE, out=noise)
+        return 1.0 + noise
+
+    def apply_aggregate_watermark(self, table, username, key_columns, value_columns=None):
+        """
+        Applique le watermark à un tableau agrégé (mode "aggregate")
+
+        Args:
+            table: DataFrame agrégé (non modifié)
+            username: Nom de l'utilisateur
+            key_columns: Colonnes de regroupement (identité de chaque agrégat)
+            value_columns: Mesures à bruiter (défaut : POIDS_TONNES)
+
+        Returns:
+            DataFrame watermarké (ou original si admin)
+        """
+        if username == self.ADMIN_USER:
+            return table.copy(deep=False)
+
+        table_watermarked = table.copy(deep=False)
+        factors = self.aggregate_noise_factors(username, table[list(key_columns)])
+
+        for col in value_columns or ['POIDS_TONNES']:
+            if col in table_watermarked.columns:
+                table_watermarked[col] = table_watermarked[col].to_numpy(dtype=np.float64) * factors
+
+        self._log_watermark(username, len(table_watermarked))
+
+        return table_watermarked
+
+    def verify_aggregate_watermark(self, table, username, original_table, key_columns,
+                                   dimensions=None, value_column='POIDS_TONNES'):
+        """
+        Vérifie si un tableau agrégé provient d'un utilisateur (mode "aggregate")
+
+        Args:
+            table: Tableau suspect (dimensions + value_column)
+            username: Nom de l'utilisateur suspecté
+            original_table: Agrégat exact à l'identité key_columns (ex. cube.base)
+            key_columns: Colonnes d'identité utilisées au watermarking
+            dimensions: Regroupement du tableau suspect (défaut : key_columns),
+                        le watermark attendu est ré-agrégé à ce niveau
+
+        Returns:
+            dict avec score de correspondance et détails
+        """
+        if self.get_user_seed(username) is None:
+            return {"match": False, "score": 0, "reason": "Admin user - no watermark"}
 
-        np.random.seed(seed)
-        noise_factor = np.random.normal(0, self.NOISE_PERCENTAGE)
-        noise_factor = np.clip(noise_factor, -self.MAX_NOISE, self.MAX_NOISE)
+        dimensions = list(dimensions or key_columns)
+        expected = self.apply_aggregate_watermark(original_table, username, key_columns, [value_column])
+        expected = expected.groupby(dimensions, observed=True)[value_column].sum()
 
-        return value * (1 + noise_factor)
+        suspect = table.groupby(dimensions, observed=True)[value_column].sum()
+        expected, suspect = expected.align(suspect, join='inner')
+
+        # Même tolérance que le mode ligne (0.01%), sur les groupes comparés
+        diff = np.abs((suspect - expected) / expected)
+        matches = int((diff < 0.0001).sum())
+        score = matches / len(suspect) if len(suspect) > 0 else 0
+
+        return {
+            "match": score > 0.95,
+            "score": score,
+            "username": username,
+            "confidence": "HIGH" if score > 0.95 else "MEDIUM" if score > 0.80 else "LOW"
+        }
 
     def _log_watermark(self, username, n_rows):
         """Log l'application du watermark"""
@@ -134,7 +432,12 @@ class DataWatermarking:
             return {"match": False, "score": 0, "reason": "Admin user - no watermark"}
 
         # Régénérer le watermark pour cet utilisateur
-        df_expected = self.apply_watermark(original_df, username)
+        df_expected = self.apply_watermark(original_df, username, log=False)
+
+        # Aligner les lignes par contenu puis poids le plus proche (et non par
+        # position) : une fuite ancienne reste vérifiable contre le master actuel
+        rows = self.row_index(original_df).locate(df)
+        found = rows >= 0
 
         # Comparer les valeurs
         matches = 0
@@ -142,8 +445,12 @@ class DataWatermarking:
 
         for col in self.WATERMARK_COLUMNS:
             if col in df.columns and col in df_expected.columns:
-                # Calculer la différence relative
-                diff = np.abs((df[col] - df_expected[col]) / df_expected[col])
+                aligned = np.full(len(df), np.nan)
+                aligned[found] = df_expected[col].to_numpy(dtype=np.float64)[rows[found]]
+
+                # Calculer la différence relative (lignes absentes de l'original : pas de correspondance)
+                with np.errstate(divide='ignore', invalid='ignore'):
+                    diff = np.abs((df[col].to_numpy(dtype=np.float64) - aligned) / aligned)
                 matches += (diff < 0.0001).sum()  # Tolérance de 0.01%
                 total += len(df)
 
@@ -174,6 +481,7 @@ class DataWatermarking:
             "enabled": True,
             "user": username,
             "type": "Invisible data fingerprinting",
+            "mode": self.WATERMARK_MODE,
             "noise_level": f"±{self.NOISE_PERCENTAGE * 100:.1f}%",
             "seed": seed,
             "description": "Données légèrement modifiées pour traçabilité"
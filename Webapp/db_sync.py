@@ -9,6 +9,8 @@ from pathlib import Path
 from datetime import datetime
 import logging
 
+from log_rotation import CompressingRotatingFileHandler
+
 # Configuration des chemins
 LOCAL_DB_PATH = Path("../Master_Data/DB_Shipping_Master.xlsx")
 WEBAPP_DB_PATH = Path("DB_Shipping_Master.xlsx")
@@ -26,7 +28,7 @@ def setup_logging():
         level=logging.INFO,
         format='%(asctime)s - %(levelname)s - %(message)s',
         handlers=[
-            logging.FileHandler(log_dir / "db_sync.log", encoding='utf-8'),
+            CompressingRotatingFileHandler(log_dir / "db_sync.log"),
             logging.StreamHandler()
         ]
     )
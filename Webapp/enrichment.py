@@ -0,0 +1,208 @@
+"""
+WATCHAI - Enrichissement vectorisé des expéditions
+Colonnes dérivées SAISON, ANNEE, MOIS, MOIS_NOM, PRODUIT et POIDS_TONNES
+"""
+
+import numpy as np
+import pandas as pd
+
+# Catégorie produit selon les 4 premiers chiffres du POSTAR (chapitre SH 18)
+PRODUCT_BY_HS_CODE = {
+    '1801': 'FEVES',
+    '1802': 'COQUES',
+    '1803': 'LIQUEUR',  # Pâte de cacao / Liqueur
+    '1804': 'BEURRE',
+    '1805': 'POUDRE',
+    '1806': 'CHOCOLAT',
+}
+DEFAULT_PRODUCT = 'FEVES'
+
+# Abréviations de mois identiques à dt.strftime('%b')
+MONTH_ABBREVIATIONS = {month: pd.Timestamp(2000, month, 1).strftime('%b') for month in range(1, 13)}
+
+
+def determine_season(date):
+    """Détermine la saison cacaoyère (Oct-Sept)"""
+    if pd.isna(date):
+        return None
+    try:
+        month = date.month
+        year = date.year
+        if month >= 10:
+            return f"{year}-{year+1}"
+        else:
+            return f"{year-1}-{year}"
+    except:
+        return None
+
+
+def categorize_product(postar):
+    """Catégorise le produit selon le code POSTAR"""
+    if pd.isna(postar):
+        return 'FEVES'
+
+    # Convertir en string et prendre les 4 premiers chiffres
+    postar_str = str(int(postar)) if isinstance(postar, (int, float)) else str(postar).strip()
+
+    # Les codes POSTAR peuvent avoir 4, 6 ou 10 chiffres - on prend les 4 premiers
+    if len(postar_str) >= 4:
+        code = postar_str[:4]
+    else:
+        code = postar_str
+
+    # Catégoriser selon les 4 premiers chiffres
+    if code == '1801':
+        return 'FEVES'
+    elif code == '1803':
+        return 'LIQUEUR'  # Pâte de cacao / Liqueur
+    elif code == '1804':
+        return 'BEURRE'
+    elif code == '1805':
+        return 'POUDRE'
+    elif code == '1806':
+        return 'CHOCOLAT'
+    elif code == '1802':
+        return 'COQUES'
+    else:
+        # Par défaut FEVES
+        return 'FEVES'
+
+
+def season_labels(dates):
+    """
+    SAISON vectorisée : '2024-2025' d'octobre 2024 à septembre 2025
+
+    Les libellés ne sont formatés qu'une fois par saison distincte.
+    """
+    start_year = dates.dt.year - (dates.dt.month < 10)
+    codes, uniques = pd.factorize(start_year)
+
+    # Le code -1 (date manquante) pointe sur le dernier libellé : None
+    labels = np.array([f"{int(year)}-{int(year) + 1}" for year in uniques] + [None], dtype=object)
+    return pd.Series(labels[codes], index=dates.index)
+
+
+def _postar_text(values):
+    """POSTAR en texte selon la règle de categorize_product (int → str, sinon strip)"""
+    values = pd.Series(values)
+    if pd.api.types.is_numeric_dtype(values):
+        return values.astype('int64').astype(str)
+    return values.map(lambda v: str(int(v)) if isinstance(v, (int, float)) else str(v).strip())
+
+
+def product_labels(postar, categories=None):
+    """
+    PRODUIT vectorisé : catégorie explicite si renseignée, sinon chapitre SH du POSTAR
+
+    Le POSTAR n'est converti qu'une fois par code distinct (factorize), la
+    correspondance code → catégorie est ensuite appliquée par indexation.
+    """
+    codes, uniques = pd.factorize(postar)
+
+    hs_codes = _postar_text(uniques).str[:4] if len(uniques) else pd.Series([], dtype=object)
+    labels = hs_codes.map(PRODUCT_BY_HS_CODE).fillna(DEFAULT_PRODUCT).to_numpy(dtype=object)
+
+    # Le code -1 (POSTAR manquant) pointe sur le dernier libellé : FEVES
+    labels = np.append(labels, DEFAULT_PRODUCT)
+    products = pd.Series(labels[codes], index=postar.index)
+
+    if categories is not None:
+        explicit = categories.notna()
+        if explicit.any():
+            products = products.where(~explicit, categories.astype(str).str.strip())
+
+    return products
+
+
+def add_derived_columns(df):
+    """
+    Ajoute les colonnes dérivées utilisées par le dashboard
+
+    - Supprime les lignes sans DATENR exploitable
+    - SAISON, ANNEE, MOIS, MOIS_NOM depuis DATENR
+    - PRODUIT depuis CATEGORIE_PRODUIT (si renseignée) ou POSTAR
+    - POIDS_TONNES depuis PDSNET (kg)
+    """
+    df = df.copy()
+    df['DATENR'] = pd.to_datetime(df['DATENR'], errors='coerce')
+    df = df[df['DATENR'].notna()].copy()
+
+    # Ajouter la saison cacaoyère
+    df['SAISON'] = season_labels(df['DATENR'])
+    df = df[df['SAISON'].notna()].copy()
+
+    # Ajouter colonnes temporelles
+    df['ANNEE'] = df['DATENR'].dt.year
+    df['MOIS'] = df['DATENR'].dt.month
+    df['MOIS_NOM'] = df['MOIS'].map(MONTH_ABBREVIATIONS)
+
+    # Catégoriser les produits - utiliser la colonne si disponible, sinon POSTAR
+    df['PRODUIT'] = product_labels(df['POSTAR'], df.get('CATEGORIE_PRODUIT'))
+
+    # Poids en tonnes
+    df['POIDS_TONNES'] = pd.to_numeric(df['PDSNET'], errors='coerce') / 1000
+
+    return df
+
+
+# Dimensions encodées en catégories (codes entiers + dictionnaire des valeurs)
+CATEGORICAL_COLUMNS = [
+    'EXPORTATEUR SIMPLE',
+    'DESTINATAIRE SIMPLE',
+    'DESTINATION',
+    'PORT',
+    'PRODUIT',
+    'SAISON',
+    'EXPORTATEUR',
+    'DESTINATAIRE',
+    'ORIGINE',
+    'POSTAR',
+    'MOIS_NOM',
+]
+
+
+def compact_dimensions(df):
+    """
+    Encode les dimensions texte en catégories pour réduire la mémoire
+
+    Chaque valeur distincte n'est stockée qu'une fois ; les lignes ne portent
+    qu'un code entier (int8/int16/int32 selon la cardinalité). Les group-by
+    sur ces colonnes travaillent directement sur les codes.
+    """
+    df = df.copy()
+    for col in CATEGORICAL_COLUMNS:
+        if col in df.columns:
+            df[col] = df[col].astype('category')
+
+    # Saisons ordonnées pour des tris chronologiques directs
+    if 'SAISON' in df.columns:
+        df['SAISON'] = df['SAISON'].cat.as_ordered()
+
+    return df
+
+
+def memory_report(df):
+    """
+    Mémoire par colonne avant (objets Python) et après encodage en catégories
+
+    Returns:
+        DataFrame ['Colonne', 'Avant (octets)', 'Après (octets)', 'Réduction'] + ligne TOTAL
+    """
+    rows = []
+    for col in df.columns:
+        after = int(df[col].memory_usage(deep=True, index=False))
+        if isinstance(df[col].dtype, pd.CategoricalDtype):
+            before = int(df[col].astype(object).memory_usage(deep=True, index=False))
+        else:
+            before = after
+        rows.append({'Colonne': col, 'Avant (octets)': before, 'Après (octets)': after})
+
+    report = pd.DataFrame(rows)
+    total = {
+        'Colonne': 'TOTAL',
+        'Avant (octets)': int(report['Avant (octets)'].sum()),
+        'Après (octets)': int(report['Après (octets)'].sum())
+    }
+    report = pd.concat([report, pd.DataFrame([total])], ignore_index=True)
+    report['Réduction'] = 1 - report['Après (octets)'] / report['Avant (octets)'].where(report['Avant (octets)'] > 0)
+    return report
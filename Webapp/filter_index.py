@@ -0,0 +1,83 @@
+"""
+WATCHAI - Index des filtres de la sidebar
+Pour chaque dimension, identifiants de lignes triés et regroupés par valeur
+
+Construit une fois par version des données. Une combinaison de filtres se
+résout par intersection des listes de lignes, sans parcourir les colonnes
+complètes.
+"""
+
+import numpy as np
+
+
+def _contains(rows, candidates):
+    """Masque des candidats présents dans une liste triée de lignes (O(candidats log lignes))"""
+    if len(rows) == 0:
+        return np.zeros(len(candidates), dtype=bool)
+    positions = np.searchsorted(rows, candidates)
+    positions[positions == len(rows)] = 0
+    return rows[positions] == candidates
+
+
+class FilterIndex:
+    """Identifiants de lignes par (dimension, valeur) d'une table"""
+
+    def __init__(self, table, dimensions):
+        """
+        Args:
+            table: DataFrame indexé (positions 0..n-1)
+            dimensions: Colonnes à indexer (converties en catégories si besoin)
+        """
+        self._index = {}
+
+        for dimension in dimensions:
+            values = table[dimension]
+            if values.dtype.name != 'category':
+                values = values.astype('category')
+
+            # Code -1 (valeur manquante) décalé en 0 : lignes groupées par code croissant
+            codes = values.cat.codes.to_numpy().astype(np.int64) + 1
+            order = np.argsort(codes, kind='stable')
+            counts = np.bincount(codes, minlength=len(values.cat.categories) + 1)
+            offsets = np.concatenate([[0], np.cumsum(counts)])
+
+            self._index[dimension] = (values.cat.categories, offsets, order)
+
+    def slices(self, dimension, values):
+        """Listes triées de lignes, une par valeur présente dans l'index"""
+        categories, offsets, order = self._index[dimension]
+
+        codes = np.unique(categories.get_indexer(list(values)))
+        return [order[offsets[code + 1]:offsets[code + 2]] for code in codes[codes >= 0]]
+
+    def select(self, filters):
+        """
+        Lignes satisfaisant tous les filtres
+
+        Seule la dimension la plus sélective est matérialisée ; ses lignes
+        sont ensuite vérifiées par recherche dichotomique dans les listes
+        des autres dimensions.
+
+        Args:
+            filters: dict {dimension: valeurs}, liste vide = pas de filtre
+
+        Returns:
+            Positions triées, ou None si aucun filtre actif (toutes les lignes)
+        """
+        active = [self.slices(dimension, values) for dimension, values in filters.items() if len(values)]
+        if not active:
+            return None
+
+        active.sort(key=lambda slices: sum(len(rows) for rows in slices))
+        first = active[0]
+        if not first:
+            return np.empty(0, dtype=np.int64)
+        selected = first[0] if len(first) == 1 else np.sort(np.concatenate(first))
+
+        for slices in active[1:]:
+            keep = np.zeros(len(selected), dtype=bool)
+            for rows in slices:
+                keep |= _contains(rows, selected)
+            selected = selected[keep]
+
+        return selected
@@ -0,0 +1,119 @@
+"""
+WATCHAI - Rotation des fichiers de log
+Rotation par taille et par âge, segments archivés compressés en gzip
+
+    access.log          segment courant
+    access.log.1.gz     archive la plus récente
+    ...
+    access.log.N.gz     archive la plus ancienne (N = backup_count)
+
+tail_log lit la fin du segment courant puis, si besoin, les archives.
+"""
+
+import gzip
+import os
+import shutil
+import time
+from datetime import datetime
+from logging.handlers import RotatingFileHandler
+from pathlib import Path
+
+from log_tail import tail_lines
+
+# Valeurs par défaut des logs WATCHAI
+MAX_BYTES = 5 * 1024 * 1024  # 5 Mo par segment
+MAX_AGE = 30 * 24 * 3600  # Un segment par mois au plus
+BACKUP_COUNT = 10  # Archives conservées
+
+
+def _gzip_rotator(source, dest):
+    """Compresse le segment terminé dans son archive puis le supprime"""
+    with open(source, 'rb') as f_in, gzip.open(dest, 'wb') as f_out:
+        shutil.copyfileobj(f_in, f_out)
+    os.remove(source)
+
+
+def _first_line_time(path):
+    """Horodatage de la première ligne ('%Y-%m-%d %H:%M:%S ...'), None si illisible"""
+    try:
+        with open(path, 'r', encoding='utf-8', errors='replace') as f:
+            first_line = f.readline()
+        return datetime.strptime(first_line[:19], '%Y-%m-%d %H:%M:%S').timestamp()
+    except (OSError, ValueError):
+        return None
+
+
+class CompressingRotatingFileHandler(RotatingFileHandler):
+    """
+    RotatingFileHandler avec rotation par âge et archives gzip
+
+    Args:
+        filename: Segment courant
+        max_bytes: Taille déclenchant la rotation (0 = pas de limite)
+        max_age: Âge du segment (secondes) déclenchant la rotation (0 = pas de limite)
+        backup_count: Archives conservées (les plus anciennes sont supprimées)
+    """
+
+    def __init__(self, filename, max_bytes=MAX_BYTES, max_age=MAX_AGE, backup_count=BACKUP_COUNT,
+                 encoding='utf-8'):
+        super().__init__(filename, maxBytes=max_bytes, backupCount=backup_count, encoding=encoding)
+        self.max_age = max_age
+        self.namer = lambda name: name + ".gz"
+        self.rotator = _gzip_rotator
+
+        # Début du segment courant : première ligne du fichier existant, sinon maintenant
+        self.segment_started = _first_line_time(self.baseFilename) or time.time()
+
+    def shouldRollover(self, record):
+        if self.max_age and os.path.exists(self.baseFilename) and os.path.getsize(self.baseFilename) > 0 \
+                and time.time() - self.segment_started >= self.max_age:
+            return True
+        return super().shouldRollover(record)
+
+    def doRollover(self):
+        super().doRollover()
+        self.segment_started = time.time()
+
+
+def log_segments(path):
+    """Segments d'un log, du plus récent (segment courant) au plus ancien"""
+    path = Path(path)
+    segments = [path] if path.exists() else []
+
+    index = 1
+    while True:
+        archive = Path(f"{path}.{index}.gz")
+        if not archive.exists():
+            break
+        segments.append(archive)
+        index += 1
+    return segments
+
+
+def _segment_lines(segment):
+    """Lignes non vides d'un segment (archive gzip décompressée à la volée)"""
+    opener = gzip.open if segment.suffix == '.gz' else open
+    with opener(segment, 'rt', encoding='utf-8', errors='replace') as f:
+        for line in f:
+            line = line.rstrip('\n')
+            if line.strip():
+                yield line
+
+
+def tail_log(path, limit):
+    """
+    N dernières lignes d'un log, en remontant dans les archives si besoin
+
+    Le segment courant est lu depuis la fin ; une archive n'est décompressée
+    que si les segments plus récents n'ont pas assez de lignes.
+    """
+    lines = []
+    for segment in log_segments(path):
+        missing = limit - len(lines)
+        if missing <= 0:
+            break
+        if segment.suffix == '.gz':
+            lines = list(_segment_lines(segment))[-missing:] + lines
+        else:
+            lines = tail_lines(segment, missing) + lines
+    return lines[-limit:] if limit > 0 else []
@@ -0,0 +1,188 @@
+"""
+WATCHAI - Base de requêtes des logs (SQLite, mode WAL)
+Événements d'accès et d'activité indexés par date, utilisateur et session
+
+Alimentée par le thread d'écriture de watchai_logger. Les vues admin
+filtrent par plage de temps et agrègent par jour/heure/IP en SQL : le coût
+ne dépend plus de la longueur de l'historique. Les événements plus anciens
+que la durée de rétention sont supprimés périodiquement (prune).
+"""
+
+import json
+import sqlite3
+from datetime import datetime
+
+from sqlite_store import SQLiteStore
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    id INTEGER PRIMARY KEY,
+    epoch REAL NOT NULL,
+    timestamp TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    username TEXT,
+    session_id TEXT,
+    client_ip TEXT,
+    hostname TEXT,
+    page TEXT,
+    action TEXT,
+    user_agent TEXT,
+    details TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_events_time ON events(kind, epoch);
+CREATE INDEX IF NOT EXISTS idx_events_epoch ON events(epoch);
+CREATE INDEX IF NOT EXISTS idx_events_user ON events(username, epoch);
+CREATE INDEX IF NOT EXISTS idx_events_session ON events(session_id, epoch);
+"""
+
+COLUMNS = [
+    'epoch', 'timestamp', 'kind', 'username', 'session_id', 'client_ip',
+    'hostname', 'page', 'action', 'user_agent', 'details'
+]
+
+# Colonnes d'une entrée de session (format de sessions.jsonl)
+SESSION_COLUMNS = ['timestamp', 'session_id', 'client_ip', 'hostname', 'page', 'action', 'user_agent', 'username']
+
+
+def _epoch(timestamp):
+    """Horodatage ISO (heure locale) -> secondes depuis l'epoch"""
+    return datetime.fromisoformat(timestamp).timestamp()
+
+
+class LogStore(SQLiteStore):
+    """Base SQLite des événements de log, une connexion par thread"""
+
+    SCHEMA = SCHEMA
+    ROW_FACTORY = sqlite3.Row
+
+    def insert(self, events):
+        """
+        Ajoute des événements en une transaction
+
+        Args:
+            events: dicts avec kind, timestamp (ISO) et les champs de COLUMNS
+        """
+        rows = [
+            tuple(_epoch(event['timestamp']) if col == 'epoch' else event.get(col) for col in COLUMNS)
+            for event in events
+        ]
+        with self._connect() as conn:
+            conn.executemany(
+                f"INSERT INTO events ({', '.join(COLUMNS)}) VALUES ({', '.join('?' * len(COLUMNS))})",
+                rows
+            )
+
+    def is_empty(self):
+        """Aucun événement (import de sessions.jsonl possible)"""
+        return self._connect().execute("SELECT 1 FROM events LIMIT 1").fetchone() is None
+
+    def prune(self, older_than):
+        """
+        Supprime les événements antérieurs à une date (rétention)
+
+        Returns:
+            Nombre d'événements supprimés
+        """
+        with self._connect() as conn:
+            return conn.execute("DELETE FROM events WHERE epoch < ?", (older_than.timestamp(),)).rowcount
+
+    def import_sessions(self, path):
+        """Importe un journal de sessions JSON Lines existant (entrées 'access')"""
+        events = []
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    events.append({**json.loads(line), 'kind': 'access'})
+                except json.JSONDecodeError:
+                    continue
+        self.insert([event for event in events if event.get('timestamp')])
+
+    def recent_sessions(self, limit=50, since=None, username=None):
+        """
+        Entrées de session les plus récentes, dans l'ordre chronologique
+
+        Args:
+            limit: Nombre maximum d'entrées (None = toutes)
+            since: datetime de début de la plage (None = pas de borne)
+            username: Filtrer sur un utilisateur
+        """
+        clauses, params = ["kind = 'access'"], []
+        if since is not None:
+            clauses.append("epoch >= ?")
+            params.append(since.timestamp())
+        if username is not None:
+            clauses.append("username = ?")
+            params.append(username)
+
+        query = f"SELECT {', '.join(SESSION_COLUMNS)} FROM events WHERE {' AND '.join(clauses)} ORDER BY epoch DESC"
+        if limit is not None:
+            query += " LIMIT ?"
+            params.append(limit)
+
+        rows = self._connect().execute(query, params).fetchall()
+        return [dict(row) for row in reversed(rows)]
+
+    def session_stats(self, since=None):
+        """
+        Total, sessions du jour, IPs uniques et dernier accès
+
+        Args:
+            since: datetime de début de la plage (None = tout l'historique conservé)
+        """
+        today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0).timestamp()
+        row = self._connect().execute(
+            """
+            SELECT COUNT(*) AS total,
+                   SUM(epoch >= ?) AS today,
+                   COUNT(DISTINCT client_ip) AS unique_ips,
+                   MAX(epoch) AS last_epoch
+            FROM events WHERE kind = 'access' AND epoch >= ?
+            """,
+            (today, since.timestamp() if since is not None else float('-inf'))
+        ).fetchone()
+
+        if not row['total']:
+            return {"total": 0, "today": 0, "unique_ips": 0, "last_access": "N/A"}
+
+        return {
+            "total": row['total'],
+            "today": row['today'] or 0,
+            "unique_ips": row['unique_ips'],
+            "last_access": datetime.fromtimestamp(row['last_epoch']).isoformat()
+        }
+
+    def session_counts(self, group_by, since=None, limit=None):
+        """
+        Nombre d'entrées de session par groupe
+
+        Args:
+            group_by: 'date', 'hour', 'page', 'client_ip', 'username' ou 'session_id'
+            since: datetime de début de la plage (None = tout l'historique)
+            limit: Garder les groupes les plus fréquents
+
+        Returns:
+            Liste de (groupe, sessions) - ordre chronologique pour date/hour,
+            sinon par fréquence décroissante
+        """
+        expressions = {
+            'date': "strftime('%Y-%m-%d', epoch, 'unixepoch', 'localtime')",
+            'hour': "CAST(strftime('%H', epoch, 'unixepoch', 'localtime') AS INTEGER)",
+            'page': "page",
+            'client_ip': "client_ip",
+            'username': "username",
+            'session_id': "session_id",
+        }
+        expression = expressions[group_by]
+        order = "grp" if group_by in ('date', 'hour') else "sessions DESC"
+
+        query = f"SELECT {expression} AS grp, COUNT(*) AS sessions FROM events WHERE kind = 'access'"
+        params = []
+        if since is not None:
+            query += " AND epoch >= ?"
+            params.append(since.timestamp())
+        query += f" GROUP BY grp ORDER BY {order}"
+        if limit is not None:
+            query += " LIMIT ?"
+            params.append(limit)
+
+        return [tuple(row) for row in self._connect().execute(query, params).fetchall()]
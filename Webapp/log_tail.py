@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+WATCHAI - Lecture de la fin des fichiers de log
+Les N dernières lignes sont lues par blocs depuis la fin du fichier : le
+coût dépend de N, pas de la taille du fichier
+
+Usage:
+    python log_tail.py logs/access.log [nombre_de_lignes] [-f]
+"""
+
+import os
+import sys
+import time
+from pathlib import Path
+
+BLOCK_SIZE = 64 * 1024
+
+
+def _count_lines(data):
+    """Nombre de lignes non vides d'un bloc d'octets"""
+    return sum(1 for line in data.split(b'\n') if line.strip())
+
+
+def tail_lines(path, limit, block_size=BLOCK_SIZE):
+    """
+    Dernières lignes non vides d'un fichier (ordre du fichier)
+
+    Args:
+        path: Fichier texte UTF-8
+        limit: Nombre de lignes voulues
+        block_size: Taille des blocs lus en remontant depuis la fin
+    """
+    if limit <= 0:
+        return []
+
+    with open(path, 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        position = f.tell()
+        data = b''
+        # Lignes non vides uniquement (les lignes blanches sont écartées ensuite),
+        # plus une : la première ligne lue peut être tronquée
+        while position > 0 and _count_lines(data) <= limit:
+            read_size = min(block_size, position)
+            position -= read_size
+            f.seek(position)
+            data = f.read(read_size) + data
+
+    lines = [line for line in data.decode('utf-8', errors='replace').splitlines() if line.strip()]
+    # Première ligne possiblement tronquée si la lecture ne part pas du début
+    if position > 0:
+        lines = lines[1:]
+    return lines[-limit:]
+
+
+def follow(path, poll_interval=1.0, stop=None):
+    """
+    Nouvelles lignes ajoutées au fichier (suivi en direct, comme tail -f)
+
+    Reprend au début du fichier s'il est tronqué ou remplacé (rotation).
+
+    Args:
+        path: Fichier suivi (peut ne pas encore exister)
+        poll_interval: Attente entre deux vérifications (secondes)
+        stop: Fonction sans argument, le suivi s'arrête quand elle retourne True
+    """
+    path = Path(path)
+    f = None
+    inode = None
+    pending = ''
+
+    try:
+        while not (stop and stop()):
+            if f is None and path.exists():
+                f = open(path, 'r', encoding='utf-8', errors='replace')
+                f.seek(0, os.SEEK_END)
+                inode = os.fstat(f.fileno()).st_ino
+
+            if f is not None:
+                chunk = f.read()
+                if chunk:
+                    pending += chunk
+                    *lines, pending = pending.split('\n')
+                    for line in lines:
+                        if line.strip():
+                            yield line
+                    continue
+
+                # Rotation (nouveau fichier) ou troncature : reprendre au début
+                try:
+                    stat = path.stat()
+                except FileNotFoundError:
+                    stat = None
+                if stat is None or stat.st_ino != inode or stat.st_size < f.tell():
+                    f.close()
+                    f = None
+                    if stat is not None:
+                        f = open(path, 'r', encoding='utf-8', errors='replace')
+                        inode = os.fstat(f.fileno()).st_ino
+                    pending = ''
+                    continue
+
+            time.sleep(poll_interval)
+    finally:
+        if f is not None:
+            f.close()
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print(__doc__)
+        sys.exit(1)
+
+    args = [arg for arg in sys.argv[1:] if arg != '-f']
+    log_file = Path(args[0])
+    count = int(args[1]) if len(args) > 1 else 20
+
+    if log_file.exists():
+        for line in tail_lines(log_file, count):
+            print(line)
+
+    if '-f' in sys.argv:
+        try:
+            for line in follow(log_file):
+                print(line, flush=True)
+        except KeyboardInterrupt:
+            pass
@@ -0,0 +1,430 @@
+"""
+WATCHAI - Store partitionné de DB_Shipping_Master
+Partitions Parquet append-only par (port, mois) + manifest JSON
+
+Structure:
+    Master_Data/DB_Shipping_Store/
+    ├── manifest.json
+    ├── ABIDJAN/2025-08/part-20250924T183500123456.parquet
+    ├── ABIDJAN/2025-08/cube-20250924T183500123456.parquet
+    └── SAN_PEDRO/2025-08/part-20250924T183500123456.parquet
+
+Une intégration mensuelle n'écrit que ses nouvelles partitions puis le
+manifest : son coût ne dépend pas de la taille de l'historique. Chaque
+partition est accompagnée de son fragment de cube OLAP (olap_cube).
+
+Le manifest mémorise l'empreinte du DB_Shipping_Master.xlsx dont le store
+est issu (ou qu'il a exporté) : si l'Excel est remplacé ou restauré depuis
+une sauvegarde, le store est considéré périmé (store_is_current) et l'Excel
+fait foi jusqu'à la reconstruction par le script d'intégration.
+"""
+
+import json
+import os
+import shutil
+from datetime import datetime
+from pathlib import Path
+
+import pandas as pd
+
+from data_fingerprint import file_fingerprint
+from enrichment import add_derived_columns
+from olap_cube import aggregate_shipments
+
+# Feuilles du master Excel et port correspondant
+MASTER_SHEETS = {
+    'DB ABJ': 'ABIDJAN',
+    'DB SP': 'SAN PEDRO',
+}
+
+# Colonnes A→I du master
+MASTER_COLUMNS = [
+    'DATENR',
+    'ORIGINE',
+    'DESTINATION',
+    'EXPORTATEUR',
+    'DESTINATAIRE',
+    'POSTAR',
+    'PDSNET',
+    'EXPORTATEUR SIMPLE',
+    'DESTINATAIRE SIMPLE',
+]
+
+STORE_DIRNAME = "DB_Shipping_Store"
+MANIFEST_NAME = "manifest.json"
+
+# Partition des lignes sans date exploitable
+UNDATED_PARTITION = "NA"
+
+
+def store_dir(master_file):
+    """Dossier du store partitionné associé à DB_Shipping_Master.xlsx"""
+    return Path(master_file).parent / STORE_DIRNAME
+
+
+def manifest_path(store):
+    """Chemin du manifest d'un store"""
+    return Path(store) / MANIFEST_NAME
+
+
+def _store_schema():
+    """Schéma Arrow commun à toutes les partitions"""
+    import pyarrow as pa
+
+    return pa.schema([
+        ('DATENR', pa.timestamp('ns')),
+        ('ORIGINE', pa.string()),
+        ('DESTINATION', pa.string()),
+        ('EXPORTATEUR', pa.string()),
+        ('DESTINATAIRE', pa.string()),
+        ('POSTAR', pa.string()),
+        ('PDSNET', pa.float64()),
+        ('EXPORTATEUR SIMPLE', pa.string()),
+        ('DESTINATAIRE SIMPLE', pa.string()),
+        ('PORT', pa.string()),
+    ])
+
+
+def _cube_schema():
+    """Schéma Arrow des fragments de cube"""
+    import pyarrow as pa
+
+    return pa.schema([
+        ('SAISON', pa.string()),
+        ('MOIS', pa.int32()),
+        ('PORT', pa.string()),
+        ('PRODUIT', pa.string()),
+        ('DESTINATION', pa.string()),
+        ('EXPORTATEUR SIMPLE', pa.string()),
+        ('DESTINATAIRE SIMPLE', pa.string()),
+        ('POIDS_TONNES', pa.float64()),
+        ('NB_OPERATIONS', pa.int64()),
+        ('NB_LIGNES', pa.int64()),
+    ])
+
+
+def _normalize_postar(value):
+    """POSTAR en texte (18010000.0 → '18010000') comme categorize_product"""
+    if pd.isna(value):
+        return None
+    if isinstance(value, (int, float)):
+        return str(int(value))
+    return str(value).strip()
+
+
+def _normalize_text(series):
+    """Colonne texte homogène (noms numériques → str), manquants conservés"""
+    return series.map(lambda value: None if pd.isna(value) else str(value))
+
+
+def normalize_master_types(df, port):
+    """
+    Type les colonnes A→I d'un DataFrame au format du store
+
+    - DATENR en datetime, PDSNET en float64
+    - POSTAR et colonnes texte en chaînes (valeurs manquantes conservées)
+    """
+    out = pd.DataFrame(index=df.index)
+    for col in MASTER_COLUMNS:
+        values = df[col] if col in df.columns else pd.Series(None, index=df.index, dtype=object)
+        if col == 'DATENR':
+            out[col] = pd.to_datetime(values, errors='coerce')
+        elif col == 'PDSNET':
+            out[col] = pd.to_numeric(values, errors='coerce').astype('float64')
+        elif col == 'POSTAR':
+            out[col] = values.map(_normalize_postar)
+        else:
+            out[col] = _normalize_text(values)
+
+    out['PORT'] = port
+    return out.reset_index(drop=True)
+
+
+def load_manifest(store):
+    """Charge le manifest d'un store (None si absent ou illisible)"""
+    try:
+        with open(manifest_path(store), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+
+def _save_manifest(store, manifest):
+    """Sauvegarde atomique du manifest (fichier temporaire puis remplacement)"""
+    path = manifest_path(store)
+    temp_file = path.parent / f"temp_{path.name}"
+    with open(temp_file, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2, ensure_ascii=False)
+    temp_file.replace(path)
+
+
+def _write_cube_fragment(store, relative_part, part):
+    """Agrège une partition (format du store) et écrit son fragment de cube à côté"""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    relative = relative_part.with_name(relative_part.name.replace('part-', 'cube-', 1))
+    cube = aggregate_shipments(add_derived_columns(part))
+
+    table = pa.Table.from_pandas(cube, schema=_cube_schema(), preserve_index=False)
+    pq.write_table(table, Path(store) / relative, compression='zstd')
+    return relative.as_posix()
+
+
+def _write_partitions(store, df, port, stamp):
+    """
+    Écrit les partitions Parquet (une par mois) et leurs fragments de cube
+
+    Le manifest n'est pas modifié : l'appelant ne l'écrit qu'une fois tous
+    les fichiers complets.
+
+    Returns:
+        Liste des entrées de partition à ajouter au manifest
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    store = Path(store)
+    df = normalize_master_types(df, port)
+    months = df['DATENR'].dt.strftime('%Y-%m').fillna(UNDATED_PARTITION)
+    schema = _store_schema()
+
+    added = []
+    for month, part in df.groupby(months, sort=True):
+        relative = Path(port.replace(' ', '_')) / month / f"part-{stamp}.parquet"
+        (store / relative).parent.mkdir(parents=True, exist_ok=True)
+
+        table = pa.Table.from_pandas(part, schema=schema, preserve_index=False)
+        pq.write_table(table, store / relative, compression='zstd')
+        cube_file = _write_cube_fragment(store, relative, part)
+
+        added.append({
+            "port": port,
+            "month": month,
+            "file": relative.as_posix(),
+            "cube": cube_file,
+            "rows": int(len(part)),
+            "volume_kg": float(part['PDSNET'].sum())
+        })
+
+    return added
+
+
+def append_to_store(store, frames):
+    """
+    Ajoute des lignes au store : partitions Parquet par (port, mois), puis un seul manifest
+
+    Args:
+        store: Dossier du store (initialisé, voir build_store_from_sheets)
+        frames: dict {port: DataFrame} - port 'ABIDJAN' ou 'SAN PEDRO', lignes
+                au format A→I (issues de transform_monthly_data_to_master_format)
+
+    Returns:
+        Liste des entrées de partition ajoutées au manifest
+    """
+    store = Path(store)
+    manifest = load_manifest(store)
+    if manifest is None:
+        raise FileNotFoundError(f"Store non initialisé: {store}")
+
+    # Écrire d'abord toutes les partitions : le manifest ne référence que des fichiers complets
+    stamp = datetime.now().strftime('%Y%m%dT%H%M%S%f')
+    added = []
+    for port, df in frames.items():
+        added.extend(_write_partitions(store, df, port, stamp))
+
+    if added:
+        manifest["partitions"].extend(added)
+        manifest["version"] = manifest.get("version", 0) + 1
+        manifest["updated_at"] = datetime.now().isoformat()
+        _save_manifest(store, manifest)
+
+    return added
+
+
+def build_store_from_sheets(sheets, store, source=None, replace=False):
+    """
+    Initialise le store à partir des feuilles du master Excel
+
+    Toutes les partitions et le manifest sont écrits dans un dossier
+    temporaire, renommé en une fois à la place du store : un échec en cours
+    de route ne laisse aucun store partiel, et si deux processus initialisent
+    le store en même temps, seul le premier renommage aboutit.
+
+    Args:
+        sheets: dict {nom_feuille: DataFrame} lu depuis DB_Shipping_Master.xlsx
+        store: Dossier du store
+        source: Empreinte de l'Excel lu (file_fingerprint), mémorisée dans le manifest
+        replace: Remplacer un store existant (supprimé une fois le nouveau en place)
+
+    Raises:
+        FileExistsError: store déjà initialisé (replace=False)
+    """
+    store = Path(store)
+    if not replace and load_manifest(store) is not None:
+        raise FileExistsError(f"Store déjà initialisé: {store}")
+
+    stamp = datetime.now().strftime('%Y%m%dT%H%M%S%f')
+    temp_store = store.parent / f".{store.name}.tmp-{os.getpid()}-{stamp}"
+    temp_store.mkdir(parents=True)
+
+    try:
+        partitions = []
+        for sheet_name, port in MASTER_SHEETS.items():
+            if sheet_name in sheets:
+                partitions.extend(_write_partitions(temp_store, sheets[sheet_name], port, stamp))
+
+        manifest = {
+            "version": 1,
+            "partitions": partitions,
+            "source": source,
+            "updated_at": datetime.now().isoformat()
+        }
+        _save_manifest(temp_store, manifest)
+
+        replaced = None
+        if replace and store.exists():
+            replaced = store.parent / f".{store.name}.replaced-{stamp}"
+            store.rename(replaced)
+        elif store.exists() and not any(store.iterdir()):
+            store.rmdir()
+
+        try:
+            temp_store.rename(store)
+        except OSError:
+            if replaced is not None:
+                replaced.rename(store)
+            # Store créé entre-temps par un autre processus : il fait foi
+            elif load_manifest(store) is not None:
+                raise FileExistsError(f"Store déjà initialisé: {store}")
+            raise
+
+        # Ancien store remplacé : supprimé une fois le nouveau en place
+        if replaced is not None:
+            shutil.rmtree(replaced, ignore_errors=True)
+    finally:
+        if temp_store.exists():
+            shutil.rmtree(temp_store, ignore_errors=True)
+
+    return manifest
+
+
+def record_source(store, master_file):
+    """Mémorise l'empreinte de l'Excel exporté depuis le store (store et Excel identiques)"""
+    manifest = load_manifest(store)
+    if manifest is None:
+        return None
+
+    manifest["source"] = file_fingerprint(master_file)
+    manifest["updated_at"] = datetime.now().isoformat()
+    _save_manifest(store, manifest)
+    return manifest
+
+
+def store_is_current(master_file, manifest=None):
+    """
+    Le store reflète-t-il DB_Shipping_Master.xlsx ?
+
+    Faux si le store est absent, ou si l'Excel a changé depuis l'initialisation
+    du store ou son dernier export (remplacement, restauration d'une
+    sauvegarde) : l'Excel fait alors foi. Un store sans empreinte d'origine
+    (créé avant son enregistrement) n'est pas considéré à jour si l'Excel existe.
+    """
+    if manifest is None:
+        manifest = load_manifest(store_dir(master_file))
+    if manifest is None:
+        return False
+    if not Path(master_file).exists():
+        return True
+
+    source = manifest.get("source")
+    return bool(source) and source.get("sha256") == file_fingerprint(master_file)["sha256"]
+
+
+def read_master_store(store):
+    """
+    Assemble l'union des partitions listées dans le manifest
+
+    Returns:
+        DataFrame combiné (colonnes A→I + PORT) ou None si store absent
+    """
+    manifest = load_manifest(store)
+    if manifest is None:
+        return None
+
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    store = Path(store)
+    schema = _store_schema()
+    files = [store / partition["file"] for partition in manifest["partitions"]]
+    if not files:
+        return schema.empty_table().to_pandas()
+
+    tables = [pq.read_table(f, schema=schema) for f in files]
+    return pa.concat_tables(tables).to_pandas()
+
+
+def backfill_cube(store):
+    """
+    Écrit les fragments de cube manquants (partitions antérieures au cube)
+
+    Returns:
+        Nombre de fragments écrits
+    """
+    import pyarrow.parquet as pq
+
+    manifest = load_manifest(store)
+    if manifest is None:
+        return 0
+
+    store = Path(store)
+    schema = _store_schema()
+    written = 0
+    for partition in manifest["partitions"]:
+        if "cube" not in partition:
+            part = pq.read_table(store / partition["file"], schema=schema).to_pandas()
+            partition["cube"] = _write_cube_fragment(store, Path(partition["file"]), part)
+            written += 1
+
+    if written:
+        manifest["version"] = manifest.get("version", 0) + 1
+        manifest["updated_at"] = datetime.now().isoformat()
+        _save_manifest(store, manifest)
+
+    return written
+
+
+def read_master_cube(store):
+    """
+    Union des fragments de cube de toutes les partitions du manifest
+
+    Returns:
+        DataFrame des fragments concaténés (à ré-agréger) ou None si store
+        absent ou si une partition n'a pas encore de fragment (voir backfill_cube)
+    """
+    manifest = load_manifest(store)
+    if manifest is None:
+        return None
+    if any("cube" not in partition for partition in manifest["partitions"]):
+        return None
+
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    store = Path(store)
+    schema = _cube_schema()
+    files = [store / partition["cube"] for partition in manifest["partitions"]]
+    if not files:
+        return schema.empty_table().to_pandas()
+
+    tables = [pq.read_table(f, schema=schema) for f in files]
+    return pa.concat_tables(tables).to_pandas()
+
+
+def store_to_sheets(df):
+    """Redécoupe l'union du store en feuilles DB ABJ / DB SP (export Excel)"""
+    sheets = {}
+    for sheet_name, port in MASTER_SHEETS.items():
+        sheets[sheet_name] = df[df['PORT'] == port][MASTER_COLUMNS].reset_index(drop=True)
+    return sheets
@@ -0,0 +1,129 @@
+"""
+WATCHAI - Cube OLAP pré-agrégé des expéditions
+Tonnage et nombre d'opérations par (SAISON, MOIS, PORT, PRODUIT, DESTINATION,
+EXPORTATEUR SIMPLE, DESTINATAIRE SIMPLE) + agrégats par saison
+
+Les graphiques interrogent le plus petit agrégat couvrant leur requête :
+le coût d'affichage dépend du nombre de groupes, pas du nombre d'expéditions.
+"""
+
+from filter_index import FilterIndex
+
+# Dimensions de l'agrégat de base
+CUBE_DIMENSIONS = [
+    'SAISON',
+    'MOIS',
+    'PORT',
+    'PRODUIT',
+    'DESTINATION',
+    'EXPORTATEUR SIMPLE',
+    'DESTINATAIRE SIMPLE',
+]
+
+# Mesures additives : tonnes, poids renseignés (count), lignes (size)
+CUBE_MEASURES = ['POIDS_TONNES', 'NB_OPERATIONS', 'NB_LIGNES']
+
+# Dimensions filtrables (index de lignes de l'agrégat de base)
+INDEXED_DIMENSIONS = [
+    'SAISON',
+    'PORT',
+    'PRODUIT',
+    'DESTINATION',
+    'EXPORTATEUR SIMPLE',
+    'DESTINATAIRE SIMPLE',
+]
+
+# Agrégats pré-calculés utilisés par les vues du dashboard
+ROLLUPS = [
+    ('SAISON',),
+    ('SAISON', 'MOIS'),
+    ('SAISON', 'PORT'),
+    ('SAISON', 'PRODUIT'),
+    ('SAISON', 'DESTINATION'),
+    ('SAISON', 'EXPORTATEUR SIMPLE'),
+    ('SAISON', 'DESTINATAIRE SIMPLE'),
+]
+
+
+def aggregate_shipments(df):
+    """
+    Agrégat de base à partir des expéditions enrichies (add_derived_columns)
+
+    Les valeurs manquantes des dimensions sont conservées comme groupes :
+    les totaux par saison restent exacts même sans destination ou exportateur.
+    """
+    grouped = df.groupby(CUBE_DIMENSIONS, observed=True, dropna=False, sort=False)['POIDS_TONNES']
+    return grouped.agg(POIDS_TONNES='sum', NB_OPERATIONS='count', NB_LIGNES='size').reset_index()
+
+
+def rollup(table, dimensions, dropna=False):
+    """Ré-agrège un agrégat sur un sous-ensemble de ses dimensions (somme des mesures)"""
+    grouped = table.groupby(list(dimensions), observed=True, dropna=dropna)
+    return grouped[CUBE_MEASURES].sum().reset_index()
+
+
+class OlapCube:
+    """Agrégat de base + agrégats par saison, interrogés par query()"""
+
+    def __init__(self, base):
+        self.base = base.reset_index(drop=True)
+        self.rollups = {dimensions: rollup(self.base, dimensions) for dimensions in ROLLUPS}
+        self._filter_index = None
+
+    @classmethod
+    def from_shipments(cls, df):
+        """Construit le cube depuis les expéditions enrichies"""
+        return cls(aggregate_shipments(df))
+
+    @classmethod
+    def from_fragments(cls, fragments):
+        """Construit le cube depuis des fragments d'agrégat concaténés (une partition du store chacun)"""
+        return cls(rollup(fragments, CUBE_DIMENSIONS))
+
+    def seasons(self):
+        """Saisons présentes dans le cube (ordre croissant)"""
+        return sorted(str(season) for season in self.rollups[('SAISON',)]['SAISON'].dropna().unique())
+
+    def filter_index(self):
+        """Index des dimensions filtrables de l'agrégat de base (construit à la première demande)"""
+        if self._filter_index is None:
+            self._filter_index = FilterIndex(self.base, INDEXED_DIMENSIONS)
+        return self._filter_index
+
+    def select(self, filters):
+        """Lignes de l'agrégat de base satisfaisant les filtres {dimension: valeurs}"""
+        rows = self.filter_index().select(filters)
+        if rows is None:
+            return self.base
+        return self.base.take(rows)
+
+    def _source(self, columns):
+        """Plus petit agrégat contenant toutes les colonnes demandées"""
+        candidates = [table for dimensions, table in self.rollups.items() if set(columns) <= set(dimensions)]
+        if not candidates:
+            return self.base
+        return min(candidates, key=len)
+
+    def query(self, dimensions=(), filters=None):
+        """
+        Tonnage et opérations regroupés par dimensions
+
+        Args:
+            dimensions: Colonnes de regroupement (vide = total)
+            filters: Égalités à appliquer, ex. {'SAISON': '2024-2025'}
+
+        Returns:
+            DataFrame dimensions + POIDS_TONNES, NB_OPERATIONS, NB_LIGNES
+            (groupes à dimension manquante exclus, comme un groupby pandas)
+        """
+        dimensions = list(dimensions)
+        filters = filters or {}
+
+        table = self._source(dimensions + list(filters))
+        for col, value in filters.items():
+            table = table[table[col] == value]
+
+        if not dimensions:
+            return table[CUBE_MEASURES].sum().to_frame().T
+
+        return rollup(table, dimensions, dropna=True)
@@ -7,102 +7,185 @@ import streamlit as st
 from datetime import datetime, timedelta
 import json
 from pathlib import Path
+from collections import OrderedDict, deque
+import atexit
 import hashlib
 import random
+import sqlite3
 import string
+import threading
+import time
+
+from security_store import SecurityStore
 
 class SecurityMiddleware:
     def __init__(self):
-        self.security_log_file = Path("./logs/security.json")
-        self.security_log_file.parent.mkdir(exist_ok=True)
+        self.security_log_file = Path("./logs/security.json")  # Ancien format (migration)
+        self.security_db_file = Path("./logs/security.db")
+        self.security_db_file.parent.mkdir(exist_ok=True)
 
         # Configuration
         self.RATE_LIMIT_REQUESTS = 100  # Max requêtes par heure
         self.RATE_LIMIT_WINDOW = 3600  # Fenêtre de 1 heure en secondes
         self.SESSION_TIMEOUT = 1800  # 30 minutes d'inactivité
         self.MAX_LOGIN_ATTEMPTS = 3  # Tentatives avant CAPTCHA
+        self.LOGIN_ATTEMPT_WINDOW = 3600  # Échecs comptés sur 1 heure
         self.CAPTCHA_LENGTH = 6
-
-        # Initialiser le fichier de log si nécessaire
-        if not self.security_log_file.exists():
-            self._init_security_log()
-
-    def _init_security_log(self):
-        """Initialise le fichier de log de sécurité"""
-        try:
-            with open(self.security_log_file, 'w', encoding='utf-8') as f:
-                json.dump({
-                    "rate_limits": {},
-                    "login_attempts": {},
-                    "captcha_challenges": {},
-                    "blocked_sessions": []
-                }, f, indent=2)
-        except:
-            pass
+        self.CAPTCHA_TTL = 300  # Validité d'un CAPTCHA (5 minutes)
+        self.RATE_LIMIT_CHECKPOINT_INTERVAL = 60  # Sauvegarde des compteurs sur disque (secondes)
+        self.MAX_TRACKED_SESSIONS = 10000  # Sessions suivies au plus (les moins récentes évincées)
+        self.MAX_LOGIN_ATTEMPT_ROWS = 10000  # Échecs de connexion conservés au plus
+
+        # État persistant : SQLite (WAL), initialisé depuis security.json si présent
+        self.store = SecurityStore(self.security_db_file)
+        if self.security_log_file.exists():
+            self._migrate_security_log()
+
+        # Rate limiting en mémoire du process : une fenêtre glissante par session
+        # (au plus RATE_LIMIT_REQUESTS horodatages), restaurée depuis le dernier checkpoint
+        self._rate_lock = threading.Lock()
+        self._rate_windows = OrderedDict()  # Ordre LRU : session la moins récente en tête
+        self._rate_first_request = {}
+        self._rate_dirty = set()
+        self._restore_rate_limits()
+        self._last_checkpoint = time.time()
+        atexit.register(self.checkpoint_rate_limits)
 
     def _load_security_log(self):
-        """Charge les données de sécurité"""
+        """Charge l'ancien fichier security.json (migration vers SQLite)"""
         try:
             with open(self.security_log_file, 'r', encoding='utf-8') as f:
                 return json.load(f)
         except:
-            return {
-                "rate_limits": {},
-                "login_attempts": {},
-                "captcha_challenges": {},
-                "blocked_sessions": []
-            }
+            return {}
 
-    def _save_security_log(self, data):
-        """Sauvegarde les données de sécurité"""
+    def _migrate_security_log(self):
+        """
+        Importe security.json dans la base puis le met de côté
+
+        L'ancien fichier n'est plus jamais relu : sa taille n'a plus d'effet
+        sur le temps de démarrage ni sur les requêtes.
+        """
         try:
-            with open(self.security_log_file, 'w', encoding='utf-8') as f:
-                json.dump(data, f, indent=2)
-        except:
+            if self.store.is_empty():
+                self.store.import_legacy(self._load_security_log())
+            self.security_log_file.replace(self.security_log_file.with_suffix(".json.migrated"))
+        except (sqlite3.Error, OSError):
             pass
 
+    def _restore_rate_limits(self):
+        """Recharge les fenêtres encore valides du dernier checkpoint"""
+        now = time.time()
+        try:
+            rate_limits = self.store.load_rate_limits(since=now - self.RATE_LIMIT_WINDOW)
+        except sqlite3.Error:
+            return
+
+        windows = []
+        for session_id, entry in rate_limits.items():
+            requests = sorted(t for t in entry.get("requests", []) if now - t < self.RATE_LIMIT_WINDOW)
+            if requests:
+                windows.append((requests[-1], session_id, requests, entry.get("first_request")))
+
+        # Sessions les plus récentes en dernier (ordre LRU), dans la limite du plafond
+        for _, session_id, requests, first_request in sorted(windows)[-self.MAX_TRACKED_SESSIONS:]:
+            self._rate_windows[session_id] = deque(requests[-self.RATE_LIMIT_REQUESTS:],
+                                                   maxlen=self.RATE_LIMIT_REQUESTS)
+            self._rate_first_request[session_id] = first_request
+
+    def _window(self, session_id, current_time):
+        """Fenêtre de la session, purgée des requêtes expirées (appel sous verrou)"""
+        window = self._rate_windows.get(session_id)
+        if window is None:
+            window = self._rate_windows[session_id] = deque(maxlen=self.RATE_LIMIT_REQUESTS)
+            self._rate_first_request[session_id] = datetime.fromtimestamp(current_time).isoformat()
+
+        while window and current_time - window[0] >= self.RATE_LIMIT_WINDOW:
+            window.popleft()
+        return window
+
     def check_rate_limit(self, session_id):
         """
         Vérifie si l'utilisateur a dépassé la limite de requêtes
+
+        Fenêtre glissante en mémoire (O(1) amorti, aucun accès disque) ;
+        les compteurs sont sauvegardés au plus une fois par
+        RATE_LIMIT_CHECKPOINT_INTERVAL.
+
         Returns: (allowed: bool, remaining: int, reset_time: str)
         """
-        data = self._load_security_log()
-        rate_limits = data.get("rate_limits", {})
+        current_time = time.time()
 
-        now = datetime.now()
-        current_time = now.timestamp()
+        with self._rate_lock:
+            window = self._window(session_id, current_time)
 
-        if session_id not in rate_limits:
-            rate_limits[session_id] = {
-                "requests": [],
-                "first_request": now.isoformat()
-            }
+            if len(window) >= self.RATE_LIMIT_REQUESTS:
+                # Calculer le temps de reset (requête la plus ancienne de la fenêtre)
+                reset_time = datetime.fromtimestamp(window[0] + self.RATE_LIMIT_WINDOW)
+                return False, 0, reset_time.strftime("%H:%M:%S")
 
-        # Nettoyer les anciennes requêtes hors de la fenêtre
-        rate_limits[session_id]["requests"] = [
-            req_time for req_time in rate_limits[session_id]["requests"]
-            if current_time - req_time < self.RATE_LIMIT_WINDOW
-        ]
+            # Ajouter la requête actuelle
+            window.append(current_time)
+            self._rate_windows.move_to_end(session_id)
+            self._rate_dirty.add(session_id)
+
+            # Plafond : la session la moins récemment active est évincée
+            while len(self._rate_windows) > self.MAX_TRACKED_SESSIONS:
+                self._evict_session(next(iter(self._rate_windows)))
+            remaining = self.RATE_LIMIT_REQUESTS - len(window)
 
-        # Vérifier la limite
-        request_count = len(rate_limits[session_id]["requests"])
+            checkpoint_due = current_time - self._last_checkpoint >= self.RATE_LIMIT_CHECKPOINT_INTERVAL
+            if checkpoint_due:
+                self._last_checkpoint = current_time
 
-        if request_count >= self.RATE_LIMIT_REQUESTS:
-            # Calculer le temps de reset
-            oldest_request = min(rate_limits[session_id]["requests"])
-            reset_time = datetime.fromtimestamp(oldest_request + self.RATE_LIMIT_WINDOW)
+        if checkpoint_due:
+            self.checkpoint_rate_limits()
 
-            return False, 0, reset_time.strftime("%H:%M:%S")
+        return True, remaining, ""
 
-        # Ajouter la requête actuelle
-        rate_limits[session_id]["requests"].append(current_time)
+    def _evict_session(self, session_id):
+        """Oublie la fenêtre d'une session (appel sous verrou)"""
+        del self._rate_windows[session_id]
+        self._rate_first_request.pop(session_id, None)
+        self._rate_dirty.discard(session_id)
 
-        # Sauvegarder
-        data["rate_limits"] = rate_limits
-        self._save_security_log(data)
+    def compact(self, now=None):
+        """
+        Évince les sessions dont toutes les requêtes ont expiré
 
-        remaining = self.RATE_LIMIT_REQUESTS - len(rate_limits[session_id]["requests"])
-        return True, remaining, ""
+        Les sessions sont rangées par dernière requête : seules les
+        expirées, en tête, sont parcourues.
+        """
+        now = now or time.time()
+        with self._rate_lock:
+            while self._rate_windows:
+                session_id, window = next(iter(self._rate_windows.items()))
+                if window and now - window[-1] < self.RATE_LIMIT_WINDOW:
+                    break
+                self._evict_session(session_id)
+
+    def checkpoint_rate_limits(self):
+        """Sauvegarde les fenêtres modifiées, puis compacte la mémoire et la base"""
+        now = time.time()
+        self.compact(now)
+
+        with self._rate_lock:
+            rate_limits = {
+                session_id: {
+                    "requests": list(self._rate_windows[session_id]),
+                    "first_request": self._rate_first_request.get(session_id)
+                }
+                for session_id in self._rate_dirty
+            }
+            self._rate_dirty = set()
+
+        try:
+            self.store.save_rate_limits(rate_limits, now)
+            self.store.prune(now, self.RATE_LIMIT_WINDOW, self.LOGIN_ATTEMPT_WINDOW,
+                             max_sessions=self.MAX_TRACKED_SESSIONS,
+                             max_login_attempts=self.MAX_LOGIN_ATTEMPT_ROWS)
+        except sqlite3.Error:
+            pass
 
     def check_session_timeout(self):
         """
@@ -134,42 +217,20 @@ class SecurityMiddleware:
         Enregistre une tentative de connexion
         Returns: (needs_captcha: bool, attempts: int)
         """
-        data = self._load_security_log()
-        login_attempts = data.get("login_attempts", {})
-
         now = datetime.now()
-        current_time = now.timestamp()
 
-        if username not in login_attempts:
-            login_attempts[username] = {
-                "failed_attempts": [],
-                "last_success": None
-            }
-
-        if success:
-            # Reset les tentatives échouées
-            login_attempts[username]["failed_attempts"] = []
-            login_attempts[username]["last_success"] = now.isoformat()
-            needs_captcha = False
-            attempts = 0
-        else:
-            # Nettoyer les tentatives de plus d'1 heure
-            login_attempts[username]["failed_attempts"] = [
-                attempt_time for attempt_time in login_attempts[username]["failed_attempts"]
-                if current_time - attempt_time < 3600
-            ]
-
-            # Ajouter l'échec
-            login_attempts[username]["failed_attempts"].append(current_time)
-
-            attempts = len(login_attempts[username]["failed_attempts"])
-            needs_captcha = attempts >= self.MAX_LOGIN_ATTEMPTS
+        try:
+            if success:
+                # Reset les tentatives échouées
+                self.store.record_successful_login(username, now.isoformat())
+                return False, 0
 
-        # Sauvegarder
-        data["login_attempts"] = login_attempts
-        self._save_security_log(data)
+            # Ajouter l'échec (échecs de plus d'1 heure ignorés)
+            attempts = self.store.record_failed_login(username, now.timestamp(), self.LOGIN_ATTEMPT_WINDOW)
+        except sqlite3.Error:
+            return False, 0
 
-        return needs_captcha, attempts
+        return attempts >= self.MAX_LOGIN_ATTEMPTS, attempts
 
     def generate_captcha(self):
         """
@@ -195,7 +256,7 @@ class SecurityMiddleware:
         # Vérifier l'expiration (5 minutes)
         if 'captcha_generated_at' in st.session_state:
             generated_at = datetime.fromisoformat(st.session_state.captcha_generated_at)
-            if (datetime.now() - generated_at).total_seconds() > 300:
+            if (datetime.now() - generated_at).total_seconds() > self.CAPTCHA_TTL:
                 return False
 
         # Vérification insensible à la casse
@@ -247,28 +308,16 @@ class SecurityMiddleware:
         Récupère les informations de rate limiting pour affichage
         Returns: dict avec infos
         """
-        data = self._load_security_log()
-        rate_limits = data.get("rate_limits", {})
-
-        if session_id not in rate_limits:
-            return {
-                "total_requests": 0,
-                "limit": self.RATE_LIMIT_REQUESTS,
-                "remaining": self.RATE_LIMIT_REQUESTS
-            }
-
-        now = datetime.now().timestamp()
-
-        # Compter les requêtes dans la fenêtre actuelle
-        valid_requests = [
-            req_time for req_time in rate_limits[session_id]["requests"]
-            if now - req_time < self.RATE_LIMIT_WINDOW
-        ]
+        with self._rate_lock:
+            if session_id in self._rate_windows:
+                total_requests = len(self._window(session_id, time.time()))
+            else:
+                total_requests = 0
 
         return {
-            "total_requests": len(valid_requests),
+            "total_requests": total_requests,
             "limit": self.RATE_LIMIT_REQUESTS,
-            "remaining": max(0, self.RATE_LIMIT_REQUESTS - len(valid_requests))
+            "remaining": max(0, self.RATE_LIMIT_REQUESTS - total_requests)
         }
 
 # Instance globale
@@ -0,0 +1,171 @@
+"""
+WATCHAI - Stockage de l'état de sécurité (SQLite, mode WAL)
+Rate limiting et tentatives de connexion
+
+Chaque vérification est une requête indexée ou un upsert : les sessions
+concurrentes n'écrasent plus les écritures des autres (contrairement à la
+réécriture complète de security.json), et les lignes anciennes sont
+supprimées par des DELETE sur l'horodatage.
+"""
+
+import json
+import time
+
+from sqlite_store import SQLiteStore
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS rate_limits (
+    session_id TEXT PRIMARY KEY,
+    first_request TEXT,
+    requests TEXT NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_rate_limits_updated ON rate_limits(updated_at);
+
+CREATE TABLE IF NOT EXISTS login_attempts (
+    username TEXT NOT NULL,
+    attempted_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_login_attempts_user ON login_attempts(username, attempted_at);
+CREATE INDEX IF NOT EXISTS idx_login_attempts_time ON login_attempts(attempted_at);
+
+CREATE TABLE IF NOT EXISTS login_success (
+    username TEXT PRIMARY KEY,
+    last_success TEXT NOT NULL
+);
+
+-- Tables jamais utilisées des premières versions (CAPTCHA et blocage restent en session)
+DROP TABLE IF EXISTS captcha_challenges;
+DROP TABLE IF EXISTS blocked_sessions;
+"""
+
+
+class SecurityStore(SQLiteStore):
+    """Base SQLite de l'état de sécurité, une connexion par thread"""
+
+    SCHEMA = SCHEMA
+
+    def is_empty(self):
+        """Aucune donnée enregistrée (migration depuis security.json possible)"""
+        conn = self._connect()
+        for table in ("rate_limits", "login_attempts", "login_success"):
+            if conn.execute(f"SELECT 1 FROM {table} LIMIT 1").fetchone():
+                return False
+        return True
+
+    # --- Rate limiting -------------------------------------------------------
+
+    def load_rate_limits(self, since):
+        """Fenêtres mises à jour depuis since : {session_id: {"requests", "first_request"}}"""
+        rows = self._connect().execute(
+            "SELECT session_id, requests, first_request FROM rate_limits WHERE updated_at >= ?",
+            (since,)
+        ).fetchall()
+        return {
+            session_id: {"requests": json.loads(requests), "first_request": first_request}
+            for session_id, requests, first_request in rows
+        }
+
+    def save_rate_limits(self, rate_limits, now=None):
+        """Upsert des fenêtres {session_id: {"requests", "first_request"}}"""
+        now = now or time.time()
+        rows = [
+            (session_id, entry.get("first_request"), json.dumps(entry["requests"]), now)
+            for session_id, entry in rate_limits.items()
+        ]
+        with self._connect() as conn:
+            conn.executemany(
+                """
+                INSERT INTO rate_limits (session_id, first_request, requests, updated_at)
+                VALUES (?, ?, ?, ?)
+                ON CONFLICT(session_id) DO UPDATE SET
+                    requests = excluded.requests,
+                    updated_at = excluded.updated_at
+                """,
+                rows
+            )
+
+    # --- Tentatives de connexion ---------------------------------------------
+
+    def record_failed_login(self, username, now, window):
+        """Enregistre un échec et retourne le nombre d'échecs dans la fenêtre"""
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO login_attempts (username, attempted_at) VALUES (?, ?)",
+                (username, now)
+            )
+            (attempts,) = conn.execute(
+                "SELECT COUNT(*) FROM login_attempts WHERE username = ? AND attempted_at > ?",
+                (username, now - window)
+            ).fetchone()
+        return attempts
+
+    def record_successful_login(self, username, timestamp):
+        """Réinitialise les échecs de l'utilisateur et mémorise la connexion réussie"""
+        with self._connect() as conn:
+            conn.execute("DELETE FROM login_attempts WHERE username = ?", (username,))
+            conn.execute(
+                """
+                INSERT INTO login_success (username, last_success) VALUES (?, ?)
+                ON CONFLICT(username) DO UPDATE SET last_success = excluded.last_success
+                """,
+                (username, timestamp)
+            )
+
+    # --- Nettoyage -----------------------------------------------------------
+
+    def prune(self, now, rate_limit_window, login_window, max_sessions=None, max_login_attempts=None):
+        """
+        Supprime les lignes expirées (DELETE indexés sur l'horodatage)
+
+        max_sessions / max_login_attempts plafonnent en plus le nombre de
+        lignes conservées (les plus récentes) : la base garde une taille
+        constante même sous un afflux de sessions ou d'échecs de connexion.
+        """
+        with self._connect() as conn:
+            conn.execute("DELETE FROM rate_limits WHERE updated_at < ?", (now - rate_limit_window,))
+            conn.execute("DELETE FROM login_attempts WHERE attempted_at < ?", (now - login_window,))
+
+            if max_sessions is not None:
+                conn.execute(
+                    """
+                    DELETE FROM rate_limits WHERE updated_at < (
+                        SELECT updated_at FROM rate_limits ORDER BY updated_at DESC LIMIT 1 OFFSET ?
+                    )
+                    """,
+                    (max_sessions - 1,)
+                )
+            if max_login_attempts is not None:
+                conn.execute(
+                    """
+                    DELETE FROM login_attempts WHERE attempted_at < (
+                        SELECT attempted_at FROM login_attempts ORDER BY attempted_at DESC LIMIT 1 OFFSET ?
+                    )
+                    """,
+                    (max_login_attempts - 1,)
+                )
+
+    def import_legacy(self, data):
+        """Importe l'ancien security.json (rate_limits, login_attempts)"""
+        with self._connect() as conn:
+            # Horodatage = dernière requête : les sessions expirées partent au premier prune
+            conn.executemany(
+                "INSERT OR REPLACE INTO rate_limits (session_id, first_request, requests, updated_at) "
+                "VALUES (?, ?, ?, ?)",
+                [
+                    (session_id, entry.get("first_request"), json.dumps(entry.get("requests", [])),
+                     max(entry.get("requests", []), default=0))
+                    for session_id, entry in data.get("rate_limits", {}).items()
+                ]
+            )
+
+            for username, entry in data.get("login_attempts", {}).items():
+                conn.executemany(
+                    "INSERT INTO login_attempts (username, attempted_at) VALUES (?, ?)",
+                    [(username, t) for t in entry.get("failed_attempts", [])]
+                )
+                if entry.get("last_success"):
+                    conn.execute(
+                        "INSERT OR REPLACE INTO login_success (username, last_success) VALUES (?, ?)",
+                        (username, entry["last_success"])
+                    )
@@ -0,0 +1,265 @@
+"""
+WATCHAI - Dataset partagé avec rechargement en arrière-plan (stale-while-revalidate)
+
+Le premier chargement du process est synchrone (warm-up). Ensuite, quand
+l'empreinte du master change, le snapshot précédent reste servi pendant
+qu'un thread construit le nouveau, puis les deux sont échangés atomiquement.
+
+Le chargeur s'exécute hors de toute session Streamlit : il ne doit jamais
+appeler st.* (ni le logger, qui lit st.session_state). Il en va de même pour
+les snapshots dérivés (watermark par utilisateur), préparés dans le même
+thread avant l'échange : après le warm-up, aucune session ne reconstruit de
+données à son chargement de page.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+from enrichment import memory_report
+
+
+class MasterSnapshot:
+    """Données du master à une version donnée : expéditions enrichies + cube"""
+
+    def __init__(self, version, data, cube, warnings=None):
+        """
+        Args:
+            version: Empreinte du master
+            data: Expéditions enrichies (None si seuls des agrégats sont servis)
+            cube: OlapCube des graphiques
+            warnings: (activité, détails) à journaliser depuis une session
+        """
+        self.version = version
+        self.data = data
+        self.cube = cube
+        self.warnings = warnings or []
+        self.loaded_at = datetime.now()
+        self.reported = False  # chargement déjà journalisé par une session
+        self._memory_report = None
+
+    def view(self):
+        """
+        Vue du dataset pour une session, sans copie des données
+
+        Avec copy-on-write (activé par le dashboard), une écriture sur la vue
+        copie la colonne concernée : le snapshot partagé n'est jamais modifié.
+        """
+        return self.data.copy(deep=False)
+
+    def memory_report(self):
+        """Rapport mémoire des expéditions (calculé à la première demande)"""
+        if self._memory_report is None:
+            self._memory_report = memory_report(self.data)
+        return self._memory_report
+
+
+class SharedDataset:
+    """Snapshot courant du process, rechargé en arrière-plan quand la version change"""
+
+    # Délai avant de retenter le chargement d'une version en échec (secondes)
+    RETRY_DELAY = 60
+
+    def __init__(self, loader, prepare=None, on_swap=None):
+        """
+        Args:
+            loader: Fonction version -> MasterSnapshot (sans appel st.*)
+            prepare: Fonction snapshot -> None appelée dans le thread de
+                     rechargement avant l'échange (ex. snapshots dérivés)
+            on_swap: Fonction snapshot -> None appelée après l'échange
+        """
+        self._loader = loader
+        self._prepare = prepare
+        self._on_swap = on_swap
+        self._lock = threading.Lock()
+        self._warm_up_lock = threading.Lock()
+        self._snapshot = None
+        self._refreshing = None
+        self.last_error = None  # (version, timestamp, message)
+
+    @property
+    def snapshot(self):
+        """Snapshot actuellement servi (None avant le warm-up)"""
+        return self._snapshot
+
+    def get(self, version):
+        """
+        Snapshot à servir pour la version demandée
+
+        - Même version : snapshot courant
+        - Premier appel : chargement synchrone
+        - Nouvelle version : snapshot courant + rechargement en arrière-plan
+        """
+        snapshot = self._snapshot
+        if snapshot is None:
+            return self._warm_up(version)
+
+        if snapshot.version != version:
+            self._start_refresh(version)
+
+        return snapshot
+
+    def _warm_up(self, version):
+        """Premier chargement : les sessions concurrentes attendent le même chargement"""
+        with self._warm_up_lock:
+            if self._snapshot is None:
+                self._snapshot = self._loader(version)
+            return self._snapshot
+
+    def _start_refresh(self, version):
+        """Lance un rechargement en arrière-plan (un seul à la fois)"""
+        with self._lock:
+            if self._refreshing is not None:
+                return
+
+            # Ne pas relancer en boucle une version dont le chargement vient d'échouer
+            if self.last_error and self.last_error[0] == version \
+                    and time.time() - self.last_error[1] < self.RETRY_DELAY:
+                return
+
+            self._refreshing = version
+
+        threading.Thread(
+            target=self._refresh,
+            args=(version,),
+            name="watchai-dataset-refresh",
+            daemon=True
+        ).start()
+
+    def _refresh(self, version):
+        """Construit le nouveau snapshot (et ses dérivés) puis l'échange avec le courant"""
+        try:
+            snapshot = self._loader(version)
+        except Exception as e:
+            with self._lock:
+                self.last_error = (version, time.time(), str(e))
+                self._refreshing = None
+            return
+
+        # Dérivés préparés avant l'échange : un échec n'empêche pas de servir la nouvelle version
+        if self._prepare is not None:
+            try:
+                self._prepare(snapshot)
+            except Exception:
+                pass
+
+        with self._lock:
+            self._snapshot = snapshot
+            self._refreshing = None
+            self.last_error = None
+
+        if self._on_swap is not None:
+            self._on_swap(snapshot)
+
+    def status(self):
+        """État pour la console admin"""
+        snapshot = self._snapshot
+        return {
+            "version": snapshot.version if snapshot else None,
+            "loaded_at": snapshot.loaded_at.isoformat(timespec='seconds') if snapshot else None,
+            "refreshing": self._refreshing,
+            "last_error": self.last_error[2] if self.last_error else None
+        }
+
+
+class UserDatasetCache:
+    """
+    Snapshots dérivés par (utilisateur, version du master), éviction LRU
+
+    Le watermark d'un utilisateur est déterministe pour une version donnée :
+    il n'est calculé qu'une fois, puis partagé par toutes ses sessions. Les
+    sessions qui demandent une entrée en cours de construction attendent
+    cette construction au lieu d'en lancer une seconde.
+    """
+
+    def __init__(self, max_entries=8):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._building = {}  # clé -> threading.Event signalé en fin de construction
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, username, version, build):
+        """
+        Snapshot de l'utilisateur pour la version, construit par build() si absent
+
+        Les entrées d'une autre version sont retirées à l'insertion : elles
+        retiendraient en mémoire les colonnes de l'ancien snapshot.
+        """
+        key = (username, version)
+        while True:
+            with self._lock:
+                if key in self._entries:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return self._entries[key]
+
+                pending = self._building.get(key)
+                if pending is None:
+                    pending = self._building[key] = threading.Event()
+                    self.misses += 1
+                    break
+
+            # Construction en cours dans une autre session : attendre son résultat
+            pending.wait()
+
+        # Construction hors verrou : les autres utilisateurs ne sont pas bloqués
+        try:
+            snapshot = build()
+            with self._lock:
+                for stale in [k for k in self._entries if k[1] != version]:
+                    del self._entries[stale]
+                self._store(key, snapshot)
+        finally:
+            with self._lock:
+                del self._building[key]
+            pending.set()
+
+        return snapshot
+
+    def prebuild(self, version, build):
+        """
+        Construit pour une nouvelle version les entrées des utilisateurs récents
+
+        Appelé dans le thread de rechargement, avant l'échange des snapshots :
+        les entrées de la version courante restent servies jusque-là.
+
+        Args:
+            version: Version du nouveau snapshot
+            build: Fonction username -> snapshot dérivé (sans appel st.*)
+        """
+        with self._lock:
+            usernames = list(dict.fromkeys(username for username, _ in reversed(self._entries)))
+
+        for username in usernames[:self.max_entries]:
+            snapshot = build(username)
+            with self._lock:
+                self._entries[(username, version)] = snapshot
+
+    def retain(self, version):
+        """Retire les entrées des autres versions (après l'échange des snapshots)"""
+        with self._lock:
+            for stale in [k for k in self._entries if k[1] != version]:
+                del self._entries[stale]
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _store(self, key, snapshot):
+        """Insère une entrée (la plus récente) puis applique la limite LRU"""
+        self._entries[key] = snapshot
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def stats(self):
+        """État pour la console admin"""
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "users": sorted({username for username, _ in self._entries}),
+                "hits": self.hits,
+                "misses": self.misses
+            }
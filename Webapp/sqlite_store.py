@@ -0,0 +1,40 @@
+"""
+WATCHAI - Base commune des stores SQLite (mode WAL)
+Une connexion par thread, schéma créé à l'ouverture
+
+Utilisée par security_store (security.db) et log_store (logs.db).
+"""
+
+import sqlite3
+import threading
+from pathlib import Path
+
+
+class SQLiteStore:
+    """Base SQLite en mode WAL, une connexion par thread"""
+
+    # Script SQL de création des tables (CREATE ... IF NOT EXISTS)
+    SCHEMA = ""
+
+    # Fabrique de lignes des requêtes (ex. sqlite3.Row), None = tuples
+    ROW_FACTORY = None
+
+    def __init__(self, db_file):
+        self.db_file = Path(db_file)
+        self.db_file.parent.mkdir(parents=True, exist_ok=True)
+        self._local = threading.local()
+
+        with self._connect() as conn:
+            conn.executescript(self.SCHEMA)
+
+    def _connect(self):
+        """Connexion du thread courant (WAL : lectures concurrentes pendant une écriture)"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_file, timeout=10)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            if self.ROW_FACTORY is not None:
+                conn.row_factory = self.ROW_FACTORY
+            self._local.conn = conn
+        return conn
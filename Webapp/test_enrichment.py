@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Script de test d'équivalence de l'enrichissement vectorisé
+Compare add_derived_columns aux fonctions ligne à ligne determine_season / categorize_product
+"""
+
+import numpy as np
+import pandas as pd
+
+from enrichment import add_derived_columns, compact_dimensions, memory_report, determine_season, categorize_product
+
+
+def build_sample():
+    """Échantillon couvrant les cas limites (bascule sept/oct, NaT, formats POSTAR)"""
+    rng = np.random.default_rng(42)
+    n = 5000
+
+    dates = pd.Timestamp("2012-01-01") + pd.to_timedelta(rng.integers(0, 365 * 14, n), unit="D")
+    dates = pd.Series(dates).astype(object)
+    dates[:4] = [pd.Timestamp("2024-09-30"), pd.Timestamp("2024-10-01"), None, "pas une date"]
+
+    postar_values = [
+        18010000, 18031000, 1804, 180500, 18069010, 18020000, 999,
+        18010000.0, np.nan, None, " 1806 ", "1803", "18", "", 9901, True,
+    ]
+    postar = pd.Series(rng.choice(np.array(postar_values, dtype=object), n), dtype=object)
+
+    return pd.DataFrame({
+        "DATENR": dates,
+        "POSTAR": postar,
+        "PDSNET": rng.integers(0, 2_000_000, n).astype(float),
+        "CATEGORIE_PRODUIT": None,
+    })
+
+
+def reference_enrichment(df):
+    """Ancienne implémentation ligne à ligne de load_data_raw()"""
+    df = df.copy()
+    df['DATENR'] = pd.to_datetime(df['DATENR'], errors='coerce')
+    df = df[df['DATENR'].notna()]
+
+    df['SAISON'] = df['DATENR'].apply(determine_season)
+    df = df[df['SAISON'].notna()]
+
+    df['ANNEE'] = df['DATENR'].dt.year
+    df['MOIS'] = df['DATENR'].dt.month
+    df['MOIS_NOM'] = df['DATENR'].dt.strftime('%b')
+
+    def get_product_category(row):
+        if pd.notna(row.get('CATEGORIE_PRODUIT')):
+            return str(row['CATEGORIE_PRODUIT']).strip()
+        else:
+            return categorize_product(row['POSTAR'])
+
+    df['PRODUIT'] = df.apply(get_product_category, axis=1)
+    df['POIDS_TONNES'] = pd.to_numeric(df['PDSNET'], errors='coerce') / 1000
+    return df
+
+
+def assert_equivalent(df):
+    """Vérifie que les deux implémentations produisent exactement les mêmes colonnes"""
+    expected = reference_enrichment(df)
+    actual = add_derived_columns(df)
+
+    assert list(actual.index) == list(expected.index)
+    for col in ['SAISON', 'ANNEE', 'MOIS', 'MOIS_NOM', 'PRODUIT', 'POIDS_TONNES']:
+        assert actual[col].tolist() == expected[col].tolist(), f"Colonne {col} différente"
+
+
+def test_enrichment_matches_row_wise_functions():
+    """POSTAR mixtes (int, float, texte, manquants)"""
+    assert_equivalent(build_sample())
+
+
+def test_enrichment_numeric_postar():
+    """POSTAR lu comme colonne numérique depuis l'Excel"""
+    df = build_sample()
+    df['POSTAR'] = pd.to_numeric(df['POSTAR'], errors='coerce')
+    assert_equivalent(df)
+
+
+def test_enrichment_explicit_category():
+    """CATEGORIE_PRODUIT renseignée prioritaire sur le POSTAR"""
+    df = build_sample()
+    df.loc[::3, 'CATEGORIE_PRODUIT'] = '  BEURRE '
+    assert_equivalent(df)
+
+
+def test_compact_dimensions_preserves_values():
+    """Catégories : mêmes valeurs, mêmes agrégats, mémoire réduite"""
+    df = add_derived_columns(build_sample())
+    compact = compact_dimensions(df)
+
+    for col in ['SAISON', 'PRODUIT', 'MOIS_NOM']:
+        assert isinstance(compact[col].dtype, pd.CategoricalDtype)
+        assert compact[col].astype(object).tolist() == df[col].tolist()
+
+    expected = df.groupby('SAISON')['POIDS_TONNES'].sum()
+    actual = compact.groupby('SAISON', observed=True)['POIDS_TONNES'].sum()
+    assert actual.index.astype(str).tolist() == expected.index.tolist()
+    assert np.allclose(actual.to_numpy(), expected.to_numpy())
+
+    report = memory_report(compact)
+    total = report.iloc[-1]
+    assert total['Colonne'] == 'TOTAL'
+    assert total['Après (octets)'] < total['Avant (octets)']
+
+
+if __name__ == "__main__":
+    print("=== Test d'équivalence de l'enrichissement vectorisé ===")
+    test_enrichment_matches_row_wise_functions()
+    test_enrichment_numeric_postar()
+    test_enrichment_explicit_category()
+    test_compact_dimensions_preserves_values()
+    print("Test terminé avec succès!")
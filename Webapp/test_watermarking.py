@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+Script de test du watermarking
+Vérification des agrégats et stabilité des clés de lignes
+"""
+
+import io
+
+import numpy as np
+import pandas as pd
+
+from data_watermarking import watermarking
+from enrichment import add_derived_columns, compact_dimensions
+from master_store import normalize_master_types
+
+
+def build_cube_base():
+    """Agrégat exact (SAISON × MOIS × PORT) comme cube.base"""
+    rng = np.random.default_rng(7)
+    base = pd.MultiIndex.from_product(
+        [['2022-2023', '2023-2024'], range(1, 13), ['ABIDJAN', 'SAN PEDRO']],
+        names=['SAISON', 'MOIS', 'PORT']
+    ).to_frame(index=False)
+    base['POIDS_TONNES'] = rng.uniform(100, 10_000, len(base))
+    return base
+
+
+def build_master_sheet():
+    """Feuille du master telle qu'écrite dans l'Excel (POSTAR numérique avec manquants)"""
+    rng = np.random.default_rng(11)
+    n = 5000
+    return pd.DataFrame({
+        'DATENR': pd.Timestamp('2022-01-01') + pd.to_timedelta(rng.integers(0, 1000, n), unit='D'),
+        'ORIGINE': 'CI',
+        'DESTINATION': rng.choice(['NL', 'US', 'FR', None], n),
+        'EXPORTATEUR': rng.choice(['A SA', 'B SARL', 'C'], n),
+        'DESTINATAIRE': rng.choice(['X', 'Y', 1234], n),
+        'POSTAR': rng.choice([18010000, 18040000, 18031000, np.nan], n),
+        'PDSNET': rng.integers(1000, 50000, n).astype(float),
+        'EXPORTATEUR SIMPLE': rng.choice(['A', 'B', 'C'], n),
+        'DESTINATAIRE SIMPLE': rng.choice(['X', 'Y'], n),
+    })
+
+
+def test_row_keys_identical_across_loaders():
+    """Mêmes clés de lignes que les expéditions viennent de l'Excel ou du store Parquet"""
+    import pyarrow as pa
+    from master_store import _store_schema
+
+    buffer = io.BytesIO()
+    build_master_sheet().to_excel(buffer, index=False)
+    buffer.seek(0)
+    sheet = pd.read_excel(buffer)
+    assert sheet['POSTAR'].dtype == np.float64
+
+    # Excel brut (POSTAR 18010000.0) et store (POSTAR '18010000' relu du Parquet)
+    excel_df = sheet.assign(PORT='ABIDJAN')
+    table = pa.Table.from_pandas(normalize_master_types(sheet, 'ABIDJAN'), schema=_store_schema(), preserve_index=False)
+    store_df = table.to_pandas()
+
+    expected = watermarking.row_keys(store_df)
+    assert (watermarking.row_keys(excel_df) == expected).all()
+
+    # Colonnes dérivées et dimensions en catégories (snapshot du dashboard)
+    dashboard_df = compact_dimensions(add_derived_columns(excel_df))
+    assert (watermarking.row_keys(dashboard_df) == expected).all()
+
+    # Export CSV relu en texte (POSTAR '18010000.0'), typé comme un fichier suspect par trace_leak
+    from trace_leak import prepare_suspect
+
+    csv_df = prepare_suspect(pd.read_csv(io.StringIO(excel_df.to_csv(index=False)), dtype=str))
+    assert (watermarking.row_keys(csv_df) == expected).all()
+
+
+def test_duplicate_content_rows():
+    """Lignes de même contenu (et même poids) : clés stables à l'ajout, fuite vérifiable"""
+    sheet = build_master_sheet()
+    duplicates = sheet.iloc[[0] * 40 + [1] * 40].reset_index(drop=True)
+    duplicates.loc[duplicates.index[40:], 'PDSNET'] += np.arange(40) * 0.5  # poids très proches
+    original = add_derived_columns(pd.concat([sheet, duplicates], ignore_index=True).assign(PORT='ABIDJAN'))
+
+    # Ajout de lignes de même contenu : les clés des lignes existantes ne changent pas
+    appended = add_derived_columns(pd.concat([original, original.iloc[:500]], ignore_index=True))
+    assert (watermarking.row_keys(appended)[:len(original)] == watermarking.row_keys(original)).all()
+
+    # Fuite mélangée et partielle : même alignement pour verify_watermark et trace_leak
+    from trace_leak import LeakTracer
+
+    leak = watermarking.apply_watermark(original, 'Erick', log=False).sample(frac=0.5, random_state=3)
+    assert watermarking.verify_watermark(leak, 'Erick', original)['score'] > 0.99
+    assert watermarking.verify_watermark(leak, 'Jean', original)['score'] < 0.2
+
+    tracer = LeakTracer(original, users=['Erick', 'Jean'])
+    tracer.score_chunk(leak)
+    ranking = tracer.ranking()
+    assert ranking.iloc[0]['Utilisateur'] == 'Erick' and ranking.iloc[0]['Score'] > 0.99
+
+
+def test_aggregate_verification_finer_suspect():
+    """Tableau suspect plus fin que le regroupement vérifié : score 1 pour la source"""
+    base = build_cube_base()
+    key_columns = ['SAISON', 'MOIS', 'PORT']
+    leaked = watermarking.apply_aggregate_watermark(base, 'Erick', key_columns)
+
+    result = watermarking.verify_aggregate_watermark(leaked, 'Erick', base, key_columns, dimensions=['SAISON'])
+    assert len(leaked) > leaked['SAISON'].nunique()
+    assert result['score'] == 1.0 and result['match']
+
+    other = watermarking.verify_aggregate_watermark(leaked, 'Jean', base, key_columns, dimensions=['SAISON'])
+    assert not other['match']
+
+
+if __name__ == "__main__":
+    print("=== Test du watermarking ===")
+    test_row_keys_identical_across_loaders()
+    test_duplicate_content_rows()
+    test_aggregate_verification_finer_suspect()
+    print("Test terminé avec succès!")
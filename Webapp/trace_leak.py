@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+"""
+WATCHAI - Traçage de fuite de données
+Compare un fichier suspect (CSV/XLSX) au master et classe tous les
+utilisateurs par probabilité d'en être la source
+
+Les lignes sont alignées par clé de contenu (et non par position) : la fuite
+peut être partielle, triée autrement ou antérieure à la version actuelle du
+master. Le fichier suspect est lu par blocs, et chaque bloc est comparé au
+watermark de tous les utilisateurs en une seule passe vectorisée.
+
+Usage:
+    python trace_leak.py fichier_suspect.csv [DB_Shipping_Master.xlsx]
+"""
+
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from auth_config import USERS
+from data_watermarking import watermarking
+from enrichment import add_derived_columns
+from master_store import MASTER_SHEETS, normalize_master_types, read_master_store, store_dir, store_is_current
+
+# Lignes du fichier suspect lues par bloc
+CHUNK_SIZE = 100_000
+
+# Tolérance de correspondance (même seuil que verify_watermark)
+TOLERANCE = 0.0001
+
+DEFAULT_MASTER = Path(__file__).resolve().parent.parent / "Master_Data" / "DB_Shipping_Master.xlsx"
+
+
+def load_original(master_file):
+    """Expéditions exactes du master (store partitionné à jour, sinon Excel), comme le dashboard"""
+    df = read_master_store(store_dir(master_file)) if store_is_current(master_file) else None
+
+    if df is None:
+        sheets = pd.read_excel(master_file, sheet_name=list(MASTER_SHEETS))
+        df = pd.concat(
+            [normalize_master_types(sheets[name], port) for name, port in MASTER_SHEETS.items()],
+            ignore_index=True
+        )
+
+    return add_derived_columns(df).reset_index(drop=True)
+
+
+def prepare_suspect(chunk, port=None):
+    """
+    Type un bloc du fichier suspect au format du store
+
+    Args:
+        chunk: DataFrame brut (colonnes du master, éventuellement partielles)
+        port: Port à utiliser si la colonne PORT est absente (nom de feuille)
+    """
+    chunk = chunk.rename(columns=lambda col: str(col).strip())
+    ports = chunk['PORT'] if 'PORT' in chunk.columns else port
+
+    prepared = normalize_master_types(chunk, ports)
+    if 'PDSNET' not in chunk.columns:
+        prepared = prepared.drop(columns='PDSNET')
+
+    for col in watermarking.WATERMARK_COLUMNS:
+        if col in chunk.columns and col not in prepared.columns:
+            prepared[col] = pd.to_numeric(chunk[col], errors='coerce').to_numpy()
+
+    return prepared
+
+
+def read_suspect(path, chunk_size=CHUNK_SIZE):
+    """Blocs typés du fichier suspect (CSV ou XLSX), sans le charger entièrement"""
+    path = Path(path)
+
+    if path.suffix.lower() == '.csv':
+        # Séparateur détecté (',' ou ';' selon l'export)
+        for chunk in pd.read_csv(path, chunksize=chunk_size, sep=None, engine='python', dtype=str):
+            yield prepare_suspect(chunk)
+        return
+
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        for sheet in workbook.worksheets:
+            rows = sheet.iter_rows(values_only=True)
+            header = next(rows, None)
+            if header is None:
+                continue
+
+            port = MASTER_SHEETS.get(sheet.title)
+            batch = []
+            for row in rows:
+                batch.append(row)
+                if len(batch) == chunk_size:
+                    yield prepare_suspect(pd.DataFrame(batch, columns=header), port)
+                    batch = []
+            if batch:
+                yield prepare_suspect(pd.DataFrame(batch, columns=header), port)
+    finally:
+        workbook.close()
+
+
+class LeakTracer:
+    """Index du master (RowIndex) + scores cumulés de chaque utilisateur"""
+
+    def __init__(self, original, users=None):
+        """
+        Args:
+            original: Expéditions exactes (load_original)
+            users: Utilisateurs candidats (défaut : tous ceux de auth_config.USERS)
+        """
+        self.original = original
+        self.users = list(users or USERS)
+
+        # Admin : données exactes (facteur 1), signale une fuite non watermarkée
+        self._seeds = [watermarking.get_user_seed(user) for user in self.users]
+
+        # Alignement partagé avec verify_watermark : contenu puis poids le plus proche
+        self._index = watermarking.row_index(original)
+
+        self.matches = np.zeros(len(self.users), dtype=np.int64)
+        self.compared = np.zeros(len(self.users), dtype=np.int64)
+        self.rows = 0
+        self.unmatched = 0
+
+    def score_chunk(self, chunk):
+        """Compare un bloc au watermark de chaque utilisateur (matrice utilisateurs × lignes)"""
+        located = self._index.locate(chunk)
+        found = located >= 0
+
+        self.rows += len(chunk)
+        self.unmatched += int((~found).sum())
+        if not found.any():
+            return
+
+        rows = located[found]
+        keys = self._index.keys[rows]
+
+        for col in watermarking.WATERMARK_COLUMNS:
+            if col not in chunk.columns or col not in self.original.columns:
+                continue
+
+            exact = self.original[col].to_numpy(dtype=np.float64)[rows]
+            suspect = chunk[col].to_numpy(dtype=np.float64)[found]
+
+            factors = np.vstack([
+                np.ones(len(keys), dtype=np.float32) if seed is None
+                else watermarking.watermark_factors(keys, user, col).astype(np.float32)
+                for user, seed in zip(self.users, self._seeds)
+            ])
+            expected = exact * factors
+
+            with np.errstate(divide='ignore', invalid='ignore'):
+                diff = np.abs((suspect - expected) / expected)
+
+            valid = ~np.isnan(suspect) & ~np.isnan(exact)
+            self.matches += (diff < TOLERANCE).sum(axis=1)
+            self.compared += int(valid.sum())
+
+    def ranking(self):
+        """Utilisateurs classés par score de correspondance décroissant"""
+        scores = np.divide(self.matches, self.compared, out=np.zeros(len(self.users)), where=self.compared > 0)
+        ranking = pd.DataFrame({
+            'Utilisateur': self.users,
+            'Watermark': ['Aucun (données exactes)' if seed is None else 'Oui' for seed in self._seeds],
+            'Valeurs comparées': self.compared,
+            'Correspondances': self.matches,
+            'Score': scores,
+        })
+        ranking['Confiance'] = np.select(
+            [ranking['Score'] > 0.95, ranking['Score'] > 0.80], ['HIGH', 'MEDIUM'], default='LOW'
+        )
+        return ranking.sort_values('Score', ascending=False, kind='stable').reset_index(drop=True)
+
+
+def trace_leak(suspect_file, master_file=DEFAULT_MASTER, users=None, chunk_size=CHUNK_SIZE):
+    """
+    Classe les utilisateurs candidats pour un fichier suspect
+
+    Returns:
+        (ranking DataFrame, LeakTracer) - le traceur porte les compteurs de lignes
+    """
+    tracer = LeakTracer(load_original(master_file), users)
+    for chunk in read_suspect(suspect_file, chunk_size):
+        tracer.score_chunk(chunk)
+    return tracer.ranking(), tracer
+
+
+def main(argv):
+    if len(argv) < 2:
+        print(__doc__)
+        return 1
+
+    suspect_file = Path(argv[1])
+    master_file = Path(argv[2]) if len(argv) > 2 else DEFAULT_MASTER
+
+    print(f"🔎 Fichier suspect: {suspect_file}")
+    print(f"📚 Master: {master_file}")
+
+    ranking, tracer = trace_leak(suspect_file, master_file)
+
+    print(f"📄 Lignes lues: {tracer.rows:,} | non retrouvées dans le master: {tracer.unmatched:,}")
+    print()
+    print(ranking.to_string(index=False, formatters={'Score': '{:.1%}'.format}))
+
+    top = ranking.iloc[0]
+    print()
+    if top['Confiance'] == 'HIGH':
+        print(f"🚨 Source probable: {top['Utilisateur']} (score {top['Score']:.1%})")
+    else:
+        print("❔ Aucune correspondance concluante")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -6,11 +6,31 @@ Module de logging pour tracer les connexions et l'utilisation de la webapp
 import os
 import json
 import logging
-from datetime import datetime
+from datetime import datetime, timedelta
 from pathlib import Path
 import streamlit as st
-import hashlib
+import atexit
+import queue
 import socket
+import threading
+import time
+import uuid
+import sqlite3
+from functools import lru_cache
+
+from log_store import LogStore
+from log_rotation import CompressingRotatingFileHandler
+from log_tail import tail_lines
+
+# Clé de st.session_state portant l'identité du client
+CLIENT_IDENTITY_KEY = "watchai_client_identity"
+
+
+@lru_cache(maxsize=1)
+def _hostname():
+    """Nom de la machine (constant pour le process)"""
+    return socket.gethostname()
+
 
 class WatchAILogger:
     def __init__(self, logs_dir="./logs"):
@@ -24,20 +44,39 @@ class WatchAILogger:
 
         # Fichiers de logs
         self.access_log_file = self.logs_dir / "access.log"
-        self.session_log_file = self.logs_dir / "sessions.json"
+        self.session_log_file = self.logs_dir / "sessions.jsonl"
+        self.legacy_session_log_file = self.logs_dir / "sessions.json"
         self.activity_log_file = self.logs_dir / "activity.log"
 
+        # Rotation du journal des sessions (JSON Lines, une entrée par ligne)
+        self.SESSION_LOG_MAX_BYTES = 1024 * 1024  # 1 Mo par fichier
+        self.SESSION_LOG_MAX_AGE = 7 * 24 * 3600  # Un fichier par semaine au plus
+        self.SESSION_LOG_BACKUPS = 3  # sessions.jsonl.1 ... .3
+        self._session_lock = threading.Lock()
+
+        # File d'événements écrite par un thread dédié : aucun accès disque sur le thread Streamlit
+        self.LOG_QUEUE_SIZE = 10000  # Au-delà, les événements sont abandonnés (jamais bloquant)
+        self.LOG_BATCH_SIZE = 500  # Événements écrits par lot
+        self._queue = queue.Queue(maxsize=self.LOG_QUEUE_SIZE)
+        self._writer = None
+        self._writer_lock = threading.Lock()
+        self.dropped_events = 0
+
+        # Rétention de la base des logs et fenêtre des statistiques admin
+        self.LOG_RETENTION_DAYS = 365  # Événements plus anciens supprimés de logs.db
+        self.LOG_PRUNE_INTERVAL = 3600  # Purge au plus une fois par heure (secondes)
+        self.STATS_WINDOW_DAYS = 30  # Statistiques calculées sur les 30 derniers jours
+        self._last_prune = 0
+
         # Configuration du logger principal
         self.setup_logging()
 
-        # Initialiser le fichier de sessions s'il n'existe pas
-        try:
-            if not self.session_log_file.exists():
-                with open(self.session_log_file, 'w', encoding='utf-8') as f:
-                    json.dump({"sessions": []}, f, indent=2)
-        except (PermissionError, OSError):
-            # Ignorer si impossible de créer le fichier
-            pass
+        # Reprendre l'ancien sessions.json (réécrit en entier à chaque accès)
+        self._migrate_legacy_sessions()
+        self._session_log_started = self._session_log_start_time()
+
+        # Base de requêtes des vues admin (alimentée par le thread d'écriture)
+        self.log_store = self._open_log_store()
 
     def setup_logging(self):
         """Configure le logging system"""
@@ -47,7 +86,8 @@ class WatchAILogger:
             self.access_logger.setLevel(logging.INFO)
 
             # Handler pour fichier d'accès
-            access_handler = logging.FileHandler(self.access_log_file, encoding='utf-8')
+            # Rotation par taille/âge, archives gzip (access.log.1.gz ...)
+            access_handler = CompressingRotatingFileHandler(self.access_log_file)
             access_formatter = logging.Formatter(
                 '%(asctime)s | %(levelname)s | %(message)s',
                 datefmt='%Y-%m-%d %H:%M:%S'
@@ -63,7 +103,7 @@ class WatchAILogger:
             self.activity_logger.setLevel(logging.INFO)
 
             # Handler pour fichier d'activité
-            activity_handler = logging.FileHandler(self.activity_log_file, encoding='utf-8')
+            activity_handler = CompressingRotatingFileHandler(self.activity_log_file)
             activity_handler.setFormatter(access_formatter)
 
             if not self.activity_logger.handlers:
@@ -82,12 +122,15 @@ class WatchAILogger:
             if not self.activity_logger.handlers:
                 self.activity_logger.addHandler(console_handler)
 
-    def get_client_info(self):
-        """Récupère les informations du client"""
-        try:
-            # Informations de la session Streamlit
-            session_info = st.session_state.get('session_info', {})
+    def _client_identity(self):
+        """
+        Identité du client, calculée une fois par session Streamlit
 
+        Le session_id est stable pour toute la session : les lignes de log
+        d'une même session peuvent être regroupées.
+        """
+        identity = st.session_state.get(CLIENT_IDENTITY_KEY)
+        if identity is None:
             # Tentative de récupération de l'IP (limitée dans Streamlit Cloud)
             client_ip = "unknown"
             try:
@@ -95,19 +138,24 @@ class WatchAILogger:
             except:
                 pass
 
-            # User agent approximatif basé sur les headers disponibles
-            user_agent = "Streamlit Client"
+            identity = {
+                "session_id": uuid.uuid4().hex[:12],
+                "client_ip": client_ip,
+                # User agent approximatif basé sur les headers disponibles
+                "user_agent": "Streamlit Client",
+                "hostname": _hostname()
+            }
+            st.session_state[CLIENT_IDENTITY_KEY] = identity
 
-            # ID de session unique basé sur le timestamp et des données Streamlit
-            session_data = str(datetime.now()) + str(hash(str(st.session_state)))
-            session_id = hashlib.md5(session_data.encode()).hexdigest()[:12]
+        return identity
 
+    def get_client_info(self):
+        """Récupère les informations du client (identité de session en cache + horodatage)"""
+        try:
             return {
-                "session_id": session_id,
-                "client_ip": client_ip,
-                "user_agent": user_agent,
-                "timestamp": datetime.now().isoformat(),
-                "hostname": socket.gethostname()
+                **self._client_identity(),
+                "username": st.session_state.get("username"),
+                "timestamp": datetime.now().isoformat()
             }
         except Exception as e:
             return {
@@ -116,7 +164,7 @@ class WatchAILogger:
                 "user_agent": "unknown",
                 "timestamp": datetime.now().isoformat(),
                 "error": str(e),
-                "hostname": socket.gethostname()
+                "hostname": _hostname()
             }
 
     def log_access(self, page="webapp_volumes_reels", action="page_load"):
@@ -130,10 +178,8 @@ class WatchAILogger:
             f"Host: {client_info['hostname']}"
         )
 
-        self.access_logger.info(log_message)
-
-        # Sauvegarder aussi dans le fichier JSON des sessions
-        self.save_session_data(client_info, page, action)
+        # Sauvegarder aussi dans le journal des sessions (écrit par le thread de logging)
+        self._enqueue("access", log_message, self._session_entry(client_info, page, action))
 
     def log_activity(self, activity, details=""):
         """Log une activité utilisateur"""
@@ -146,56 +192,289 @@ class WatchAILogger:
             f"Host: {client_info['hostname']}"
         )
 
-        self.activity_logger.info(log_message)
+        event = {
+            "timestamp": client_info['timestamp'],
+            "username": client_info.get('username'),
+            "session_id": client_info['session_id'],
+            "client_ip": client_info['client_ip'],
+            "hostname": client_info['hostname'],
+            "action": activity,
+            "details": str(details)
+        }
+        self._enqueue("activity", log_message, event)
+
+    def _enqueue(self, kind, message, event):
+        """Met un événement en file (quelques microsecondes, jamais bloquant)"""
+        self._ensure_writer()
+        try:
+            self._queue.put_nowait((kind, message, event))
+        except queue.Full:
+            self.dropped_events += 1
+
+    def _ensure_writer(self):
+        """Démarre le thread d'écriture au premier événement"""
+        if self._writer is not None:
+            return
+        with self._writer_lock:
+            if self._writer is None:
+                self._writer = threading.Thread(target=self._writer_loop, name="watchai-log-writer", daemon=True)
+                self._writer.start()
+                atexit.register(self.shutdown)
+
+    def _writer_loop(self):
+        """Écrit les événements par lots : tout ce qui est en file au moment du réveil"""
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < self.LOG_BATCH_SIZE:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            stop = False
+            try:
+                sessions = []
+                events = []
+                for kind, message, event in batch:
+                    if kind == "stop":
+                        stop = True
+                        continue
+                    if kind == "access":
+                        self.access_logger.info(message)
+                        sessions.append(event)
+                    else:
+                        self.activity_logger.info(message)
+                    events.append({**event, "kind": kind})
+
+                if sessions:
+                    self._append_sessions(sessions)
+                if events and self.log_store is not None:
+                    self.log_store.insert(events)
+            except Exception as e:
+                print(f"Erreur écriture logs: {str(e)}")
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+            if stop:
+                return
+            self._prune_log_store()
+
+    def _prune_log_store(self):
+        """Supprime de la base les événements au-delà de la rétention (au plus une fois par LOG_PRUNE_INTERVAL)"""
+        now = time.time()
+        if self.log_store is None or now - self._last_prune < self.LOG_PRUNE_INTERVAL:
+            return
+        self._last_prune = now
+        try:
+            self.log_store.prune(datetime.now() - timedelta(days=self.LOG_RETENTION_DAYS))
+        except sqlite3.Error as e:
+            print(f"Erreur purge logs: {str(e)}")
+
+    def flush(self, timeout=2.0):
+        """
+        Attend l'écriture des événements en file (au plus timeout secondes)
+
+        Équivalent de queue.join() borné : attente sur la condition notifiée
+        par task_done(), sans scrutation active.
+        """
+        done = self._queue.all_tasks_done
+        with done:
+            done.wait_for(lambda: not self._queue.unfinished_tasks, timeout)
+
+    def shutdown(self, timeout=2.0):
+        """Vide la file puis arrête le thread d'écriture (appelé à la sortie du process)"""
+        writer = self._writer
+        if writer is None or not writer.is_alive():
+            return
+        try:
+            self._queue.put(("stop", None, None), timeout=timeout)
+        except queue.Full:
+            return
+        writer.join(timeout)
+
+    def _migrate_legacy_sessions(self):
+        """Convertit sessions.json en sessions.jsonl (une seule fois)"""
+        try:
+            if self.session_log_file.exists() or not self.legacy_session_log_file.exists():
+                return
+            with open(self.legacy_session_log_file, 'r', encoding='utf-8') as f:
+                sessions = json.load(f).get("sessions", [])
+            with open(self.session_log_file, 'w', encoding='utf-8') as f:
+                f.writelines(json.dumps(entry, ensure_ascii=False) + "\n" for entry in sessions)
+            self.legacy_session_log_file.replace(self.legacy_session_log_file.with_suffix(".json.migrated"))
+        except (json.JSONDecodeError, PermissionError, OSError):
+            pass
+
+    def _session_log_start_time(self):
+        """Date de début du fichier courant (premier horodatage), pour la rotation par âge"""
+        try:
+            with open(self.session_log_file, 'r', encoding='utf-8') as f:
+                first_line = f.readline()
+            return datetime.fromisoformat(json.loads(first_line)["timestamp"]).timestamp()
+        except (FileNotFoundError, json.JSONDecodeError, KeyError, ValueError, OSError):
+            return None
+
+    def _rotate_session_log(self):
+        """sessions.jsonl -> .1 -> .2 ... (le plus ancien au-delà de SESSION_LOG_BACKUPS est supprimé)"""
+        for index in range(self.SESSION_LOG_BACKUPS, 0, -1):
+            source = self.session_log_file if index == 1 else Path(f"{self.session_log_file}.{index - 1}")
+            if source.exists():
+                source.replace(f"{self.session_log_file}.{index}")
+        self._session_log_started = None
+
+    def _session_log_files(self):
+        """Fichiers du journal des sessions, du plus récent au plus ancien"""
+        files = [self.session_log_file]
+        files += [Path(f"{self.session_log_file}.{index}") for index in range(1, self.SESSION_LOG_BACKUPS + 1)]
+        return [path for path in files if path.exists()]
+
+    def _session_entry(self, client_info, page, action):
+        """Entrée du journal des sessions"""
+        return {
+            "timestamp": client_info['timestamp'],
+            "session_id": client_info['session_id'],
+            "client_ip": client_info['client_ip'],
+            "hostname": client_info['hostname'],
+            "page": page,
+            "action": action,
+            "user_agent": client_info['user_agent'],
+            "username": client_info.get('username')
+        }
 
     def save_session_data(self, client_info, page, action):
-        """Sauvegarde les données de session dans le fichier JSON"""
+        """Ajoute immédiatement une entrée au journal des sessions (sans passer par la file)"""
+        self._append_sessions([self._session_entry(client_info, page, action)])
+
+    def _append_sessions(self, entries):
+        """Ajoute des entrées au journal des sessions (une écriture, sans relire le fichier)"""
         try:
-            # Lire les données existantes
-            try:
-                with open(self.session_log_file, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-            except (FileNotFoundError, json.JSONDecodeError):
-                data = {"sessions": []}
-
-            # Ajouter la nouvelle session
-            session_entry = {
-                "timestamp": client_info['timestamp'],
-                "session_id": client_info['session_id'],
-                "client_ip": client_info['client_ip'],
-                "hostname": client_info['hostname'],
-                "page": page,
-                "action": action,
-                "user_agent": client_info['user_agent']
-            }
+            lines = "".join(json.dumps(entry, ensure_ascii=False) + "\n" for entry in entries)
 
-            data["sessions"].append(session_entry)
+            with self._session_lock:
+                # Rotation par taille ou par âge du fichier courant
+                now = time.time()
+                if self.session_log_file.exists() and (
+                    self.session_log_file.stat().st_size >= self.SESSION_LOG_MAX_BYTES
+                    or (self._session_log_started is not None
+                        and now - self._session_log_started >= self.SESSION_LOG_MAX_AGE)
+                ):
+                    self._rotate_session_log()
 
-            # Garder seulement les 1000 dernières sessions pour éviter un fichier trop volumineux
-            if len(data["sessions"]) > 1000:
-                data["sessions"] = data["sessions"][-1000:]
+                # Ajout en fin de fichier : une seule écriture par lot
+                with open(self.session_log_file, 'a', encoding='utf-8') as f:
+                    f.write(lines)
 
-            # Sauvegarder
-            with open(self.session_log_file, 'w', encoding='utf-8') as f:
-                json.dump(data, f, indent=2, ensure_ascii=False)
+                if self._session_log_started is None:
+                    self._session_log_started = now
 
         except Exception as e:
             # Log vers la console si le logger n'est pas disponible
             print(f"Erreur sauvegarde session: {str(e)}")
 
-    def get_recent_sessions(self, limit=50):
-        """Récupère les sessions récentes"""
+    def _open_log_store(self):
+        """Base SQLite des logs, initialisée depuis sessions.jsonl et ses rotations (None si indisponible)"""
         try:
-            with open(self.session_log_file, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-            return data["sessions"][-limit:] if data.get("sessions") else []
-        except (FileNotFoundError, json.JSONDecodeError, PermissionError):
+            store = LogStore(self.logs_dir / "logs.db")
+            if store.is_empty():
+                # Du plus ancien (.3) au plus récent (sessions.jsonl)
+                for path in reversed(self._session_log_files()):
+                    store.import_sessions(path)
+            return store
+        except (sqlite3.Error, OSError):
+            return None
+
+    def get_sessions_since(self, since, limit=None, username=None):
+        """Sessions depuis une date (requête indexée), dans l'ordre chronologique"""
+        self.flush(timeout=0.5)
+        if self.log_store is not None:
+            try:
+                return self.log_store.recent_sessions(limit, since=since, username=username)
+            except sqlite3.Error:
+                pass
+
+        # Sans base : fin du journal des sessions filtrée en Python
+        since_iso = since.isoformat()
+        sessions = [
+            s for s in self._tail_sessions(limit or 1000)
+            if s.get('timestamp', '') >= since_iso and (username is None or s.get('username') == username)
+        ]
+        return sessions[-limit:] if limit else sessions
+
+    def get_session_counts(self, group_by, since=None, limit=None):
+        """
+        Nombre de sessions par 'date', 'hour', 'page', 'client_ip', 'username' ou 'session_id'
+
+        Returns:
+            Liste de (groupe, sessions), vide si la base n'est pas disponible
+        """
+        self.flush(timeout=0.5)
+        if self.log_store is None:
             return []
+        try:
+            return self.log_store.session_counts(group_by, since=since, limit=limit)
+        except sqlite3.Error:
+            return []
+
+    def count_sessions(self, since=None):
+        """Nombre de sessions depuis une date (COUNT indexé si la base est disponible)"""
+        counts = self.get_session_counts('date', since=since)
+        if counts or self.log_store is not None:
+            return sum(count for _, count in counts)
+        return len(self.get_sessions_since(since)) if since is not None else len(self._tail_sessions(1000))
+
+    def get_recent_sessions(self, limit=50):
+        """Récupère les sessions récentes (base indexée, sinon fin du journal des sessions)"""
+        # Inclure les événements encore en file
+        self.flush(timeout=0.5)
+
+        if self.log_store is not None:
+            try:
+                return self.log_store.recent_sessions(limit)
+            except sqlite3.Error:
+                pass
+
+        return self._tail_sessions(limit)
+
+    def _tail_sessions(self, limit):
+        """Dernières entrées du journal des sessions (lecture de la fin des fichiers uniquement)"""
+        sessions = []
+        try:
+            for path in self._session_log_files():
+                lines = tail_lines(path, limit - len(sessions))
+                entries = []
+                for line in lines:
+                    try:
+                        entries.append(json.loads(line))
+                    except json.JSONDecodeError:
+                        continue  # Ligne incomplète (écriture en cours)
+                sessions = entries + sessions
+                if len(sessions) >= limit:
+                    break
+        except (PermissionError, OSError):
+            pass
+        return sessions[-limit:]
+
+    def get_session_stats(self, since=None):
+        """
+        Statistiques des sessions
+
+        Args:
+            since: datetime de début de la plage (défaut : les STATS_WINDOW_DAYS derniers jours)
+        """
+        if since is None:
+            since = datetime.now() - timedelta(days=self.STATS_WINDOW_DAYS)
+
+        if self.log_store is not None:
+            self.flush(timeout=0.5)
+            try:
+                return self.log_store.session_stats(since=since)
+            except sqlite3.Error:
+                pass
 
-    def get_session_stats(self):
-        """Statistiques des sessions"""
         try:
-            sessions = self.get_recent_sessions(1000)
+            since_iso = since.isoformat()
+            sessions = [s for s in self._tail_sessions(1000) if s.get('timestamp', '') >= since_iso]
             if not sessions:
                 return {"total": 0, "today": 0, "unique_ips": 0}
 
@@ -14,9 +14,28 @@ from pathlib import Path
 import hashlib
 import json
 
+# Copy-on-write : les vues du dataset partagé ne copient les colonnes qu'en cas d'écriture
+pd.set_option("mode.copy_on_write", True)
+
+# Colonnes dérivées (SAISON, PRODUIT, ...) calculées de façon vectorisée
+from enrichment import add_derived_columns, compact_dimensions
+
+# Cube OLAP pré-agrégé interrogé par les graphiques
+from olap_cube import CUBE_DIMENSIONS, OlapCube
+
+# Empreinte du master (clé de cache des données)
+from data_fingerprint import master_fingerprint
+
+# Snapshot du master partagé entre sessions, rechargé en arrière-plan
+from shared_dataset import MasterSnapshot, SharedDataset, UserDatasetCache
+
+# Analyse comparative en un group-by par dimension
+from comparative_query import ComparativeQuery
+
 # Import du système de logging WATCHAI
 try:
     from watchai_logger import watchai_logger
+    from log_rotation import tail_log
     LOGGING_ENABLED = True
 except ImportError:
     LOGGING_ENABLED = False
@@ -36,6 +55,16 @@ try:
 except ImportError:
     WATERMARKING_ENABLED = False
 
+# Import du store partitionné du master (lecture rapide)
+try:
+    from master_store import (
+        store_dir, manifest_path, load_manifest, read_master_store, read_master_cube, store_is_current,
+        normalize_master_types
+    )
+    STORE_ENABLED = True
+except ImportError:
+    STORE_ENABLED = False
+
 # Configuration de la page
 st.set_page_config(
     page_title="WatchAI - Government Logistics Intelligence",
@@ -227,11 +256,45 @@ if LOGGING_ENABLED:
         watchai_logger.log_access("webapp_volumes_reels", "page_load")
         st.session_state.logged_access = True
 
-@st.cache_data(ttl=3600, show_spinner="Chargement des données mises à jour...")
-def load_data_raw():
-    """Charge les données BRUTES depuis DB_Shipping_Master.xlsx (sans watermarking)"""
-    if LOGGING_ENABLED:
-        watchai_logger.log_activity("data_load", "Loading DB_Shipping_Master.xlsx")
+# Emplacements possibles de DB_Shipping_Master.xlsx (et du store partitionné voisin)
+MASTER_FILE_PATHS = [
+    Path("Master_Data/DB_Shipping_Master.xlsx"),  # Relatif à WATCHAI (racine Git)
+    Path("../Master_Data/DB_Shipping_Master.xlsx"),  # Depuis Webapp/ (local)
+    Path("/mount/src/watchai/Master_Data/DB_Shipping_Master.xlsx"),  # Streamlit Cloud
+]
+
+def serves_store(path):
+    """Le store voisin de l'Excel est-il la source à lire (présent et à jour) ?"""
+    return STORE_ENABLED and store_is_current(path)
+
+def get_data_fingerprint():
+    """Empreinte de la source active (manifest du store à jour, sinon DB_Shipping_Master.xlsx)"""
+    for path in MASTER_FILE_PATHS:
+        manifest_file = manifest_path(store_dir(path)) if serves_store(path) else None
+        fingerprint = master_fingerprint(path, manifest_file)
+        if fingerprint is not None:
+            return fingerprint
+    return None
+
+def get_data_version():
+    """Clé de cache des données : change exactement quand le master change"""
+    fingerprint = get_data_fingerprint()
+    return fingerprint["key"] if fingerprint else None
+
+def build_master_snapshot(data_version=None):
+    """
+    Charge les données BRUTES de DB_Shipping_Master (store partitionné ou .xlsx, sans watermarking)
+
+    Exécuté hors session (warm-up ou thread de rechargement) : aucun appel
+    st.* ni au logger ici, les avertissements sont portés par le snapshot.
+
+    Args:
+        data_version: Empreinte du master (get_data_version) au moment de la demande
+
+    Returns:
+        MasterSnapshot (expéditions enrichies + cube)
+    """
+    warnings = []
 
     # Vérifier et synchroniser la base de données automatiquement
     try:
@@ -240,143 +303,174 @@ def load_data_raw():
     except ImportError:
         pass
     except Exception as e:
-        if LOGGING_ENABLED:
-            watchai_logger.log_activity("sync_warning", f"Auto-sync failed: {str(e)}")
+        warnings.append(("sync_warning", f"Auto-sync failed: {str(e)}"))
+
+    # UNE SEULE source de données : Master_Data/ (store partitionné, sinon DB_Shipping_Master.xlsx)
+    df = None
+    for path in MASTER_FILE_PATHS:
+        # Union des partitions du store s'il est présent et reflète l'Excel
+        from_store = serves_store(path)
+        if from_store:
+            df = read_master_store(store_dir(path))
+
+        if df is None and path.exists():
+            if STORE_ENABLED and load_manifest(store_dir(path)) is not None:
+                warnings.append((
+                    "store_warning",
+                    "DB_Shipping_Master.xlsx differs from the partitioned store: serving Excel "
+                    "(run integrate_monthly_data.py to rebuild the store)"
+                ))
+            df = load_master_excel(path)
+
+        if df is not None:
+            # NE PAS utiliser la colonne 9 qui contient des valeurs incorrectes
+            df['CATEGORIE_PRODUIT'] = None
+            break
 
-    try:
-        # UNE SEULE source de données : Master_Data/DB_Shipping_Master.xlsx
-        possible_paths = [
-            Path("Master_Data/DB_Shipping_Master.xlsx"),  # Relatif à WATCHAI (racine Git)
-            Path("../Master_Data/DB_Shipping_Master.xlsx"),  # Depuis Webapp/ (local)
-            Path("/mount/src/watchai/Master_Data/DB_Shipping_Master.xlsx"),  # Streamlit Cloud
-        ]
+    if df is None:
+        raise FileNotFoundError("Impossible de trouver DB_Shipping_Master.xlsx dans Master_Data/")
 
-        df = None
-        for path in possible_paths:
-            if path.exists():
-                df_abj = pd.read_excel(path, sheet_name='DB ABJ')
-                df_sp = pd.read_excel(path, sheet_name='DB SP')
+    # Traitement des données : colonnes dérivées vectorisées
+    df = add_derived_columns(df)
 
-                # Ajouter colonne PORT
-                df_abj['PORT'] = 'ABIDJAN'
-                df_sp['PORT'] = 'SAN PEDRO'
+    # Dimensions en catégories (codes entiers + dictionnaires)
+    df = compact_dimensions(df)
 
-                # NE PAS utiliser la colonne 9 qui contient des valeurs incorrectes
-                df_abj['CATEGORIE_PRODUIT'] = None
-                df_sp['CATEGORIE_PRODUIT'] = None
+    # Cube : fragments matérialisés à l'intégration, sinon agrégé en mémoire
+    fragments = read_master_cube(store_dir(path)) if from_store else None
+    if fragments is not None:
+        cube = OlapCube.from_fragments(compact_dimensions(fragments))
+    else:
+        cube = OlapCube.from_shipments(df)
 
-                # Combiner
-                df = pd.concat([df_abj, df_sp], ignore_index=True)
-                break
+    # Index des filtres construit ici (hors session) : premier filtrage instantané
+    cube.filter_index()
 
-        if df is None:
-            st.error("Impossible de trouver DB_Shipping_Master.xlsx dans Master_Data/")
-            return None
-        
-        # Traitement des données
-        df['DATENR'] = pd.to_datetime(df['DATENR'], errors='coerce')
-        df = df[df['DATENR'].notna()]
-        
-        # Ajouter la saison cacaoyère
-        df['SAISON'] = df['DATENR'].apply(determine_season)
-        df = df[df['SAISON'].notna()]
-        
-        # Ajouter colonnes temporelles
-        df['ANNEE'] = df['DATENR'].dt.year
-        df['MOIS'] = df['DATENR'].dt.month
-        df['MOIS_NOM'] = df['DATENR'].dt.strftime('%b')
-        
-        # Catégoriser les produits - utiliser la colonne si disponible, sinon POSTAR
-        def get_product_category(row):
-            if pd.notna(row.get('CATEGORIE_PRODUIT')):
-                return str(row['CATEGORIE_PRODUIT']).strip()
-            else:
-                return categorize_product(row['POSTAR'])
-        
-        df['PRODUIT'] = df.apply(get_product_category, axis=1)
-        
-        # Poids en tonnes
-        df['POIDS_TONNES'] = pd.to_numeric(df['PDSNET'], errors='coerce') / 1000
-        
-        return df
-        
+    return MasterSnapshot(data_version, df, cube, warnings)
+
+def load_master_excel(path):
+    """Lit DB ABJ / DB SP depuis l'Excel (lecture seule : le store est construit par integrate_monthly_data.py)"""
+    df_abj = pd.read_excel(path, sheet_name='DB ABJ')
+    df_sp = pd.read_excel(path, sheet_name='DB SP')
+
+    # Mêmes types que le store (POSTAR '18010000' et non 18010000.0) : mêmes clés de watermark
+    if STORE_ENABLED:
+        return pd.concat(
+            [normalize_master_types(df_abj, 'ABIDJAN'), normalize_master_types(df_sp, 'SAN PEDRO')],
+            ignore_index=True
+        )
+
+    # Ajouter colonne PORT
+    df_abj['PORT'] = 'ABIDJAN'
+    df_sp['PORT'] = 'SAN PEDRO'
+
+    # Combiner
+    return pd.concat([df_abj, df_sp], ignore_index=True)
+
+# Nombre de jeux watermarkés (utilisateur, version) gardés en mémoire
+USER_CACHE_SIZE = 8
+
+@st.cache_resource
+def get_shared_dataset():
+    """
+    Snapshot du master partagé par toutes les sessions du process
+
+    Les snapshots watermarkés des utilisateurs récents sont reconstruits dans
+    le thread de rechargement, avant l'échange : leurs sessions n'attendent pas.
+    """
+    user_datasets = get_user_datasets()
+    return SharedDataset(
+        build_master_snapshot,
+        prepare=lambda snapshot: user_datasets.prebuild(
+            snapshot.version, lambda username: build_user_snapshot(snapshot, username)
+        ),
+        on_swap=lambda snapshot: user_datasets.retain(snapshot.version)
+    )
+
+def load_master_snapshot(data_version=None):
+    """
+    Snapshot à afficher : le précédent reste servi pendant un rechargement
+
+    Seul le premier chargement du process (warm-up) fait attendre la session.
+    """
+    if data_version is None:
+        data_version = get_data_version()
+
+    try:
+        snapshot = get_shared_dataset().get(data_version)
+    except FileNotFoundError as e:
+        st.error(str(e))
+        return None
     except Exception as e:
         st.error(f"Erreur chargement données: {e}")
         return None
 
-def load_data():
+    # Journaliser chaque nouveau snapshot une seule fois (depuis une session)
+    if LOGGING_ENABLED and not snapshot.reported:
+        snapshot.reported = True
+        watchai_logger.log_activity("data_load", f"Loaded DB_Shipping_Master ({snapshot.version})")
+        for activity, details in snapshot.warnings:
+            watchai_logger.log_activity(activity, details)
+
+    return snapshot
+
+@st.cache_resource
+def get_user_datasets():
+    """Snapshots watermarkés par (utilisateur, version du master), partagés entre sessions"""
+    return UserDatasetCache(max_entries=USER_CACHE_SIZE)
+
+def load_user_data(snapshot=None):
     """
     Charge les données et applique le watermarking selon l'utilisateur connecté
-    """
-    # Charger les données brutes (depuis cache)
-    df_raw = load_data_raw()
 
-    if df_raw is None:
+    Returns:
+        MasterSnapshot de l'utilisateur : le snapshot partagé (admin, pas
+        connecté ou watermarking désactivé) ou son dérivé watermarké (données
+        + cube, ou cube seul en mode "aggregate"), calculé une seule fois par
+        (utilisateur, version du master), dans le thread de rechargement pour
+        les utilisateurs récents
+    """
+    # Charger les données brutes (snapshot partagé, rechargé si le master a changé)
+    if snapshot is None:
+        snapshot = load_master_snapshot()
+    if snapshot is None:
         return None
 
-    # Appliquer le watermarking si activé et si utilisateur connecté
-    if WATERMARKING_ENABLED and 'username' in st.session_state:
-        username = st.session_state.username
-        df_watermarked = watermarking.apply_watermark(df_raw, username)
+    # Pas de watermarking (admin, pas connecté ou désactivé)
+    username = st.session_state.get('username')
+    if not (WATERMARKING_ENABLED and username and watermarking.get_user_seed(username) is not None):
+        return snapshot
 
-        # Logger pour l'admin
-        if LOGGING_ENABLED and username != "Julien":
-            watchai_logger.log_activity(
-                "data_watermark",
-                f"Applied watermark for user {username}"
-            )
+    user_snapshot = get_user_datasets().get(
+        username, snapshot.version, lambda: build_user_snapshot(snapshot, username)
+    )
 
-        return df_watermarked
-    else:
-        # Pas de watermarking (pas connecté ou désactivé)
-        return df_raw.copy()
+    # Logger pour l'admin (une fois par version du master, plus à chaque rerun)
+    if LOGGING_ENABLED and not user_snapshot.reported:
+        user_snapshot.reported = True
+        watchai_logger.log_activity("data_watermark", f"Applied watermark for user {username}")
 
-def determine_season(date):
-    """Détermine la saison cacaoyère (Oct-Sept)"""
-    if pd.isna(date):
-        return None
-    try:
-        month = date.month
-        year = date.year
-        if month >= 10:
-            return f"{year}-{year+1}"
-        else:
-            return f"{year-1}-{year}"
-    except:
-        return None
+    return user_snapshot
 
-def categorize_product(postar):
-    """Catégorise le produit selon le code POSTAR"""
-    if pd.isna(postar):
-        return 'FEVES'
-    
-    # Convertir en string et prendre les 4 premiers chiffres
-    postar_str = str(int(postar)) if isinstance(postar, (int, float)) else str(postar).strip()
-    
-    # Les codes POSTAR peuvent avoir 4, 6 ou 10 chiffres - on prend les 4 premiers
-    if len(postar_str) >= 4:
-        code = postar_str[:4]
-    else:
-        code = postar_str
-    
-    # Catégoriser selon les 4 premiers chiffres
-    if code == '1801':
-        return 'FEVES'
-    elif code == '1803':
-        return 'LIQUEUR'  # Pâte de cacao / Liqueur
-    elif code == '1804':
-        return 'BEURRE'
-    elif code == '1805':
-        return 'POUDRE'
-    elif code == '1806':
-        return 'CHOCOLAT'
-    elif code == '1802':
-        return 'COQUES'
-    else:
-        # Par défaut FEVES
-        return 'FEVES'
+def build_user_snapshot(snapshot, username):
+    """
+    Snapshot watermarké d'un utilisateur (sans appel st.* ni logger)
 
-def display_header(df):
+    Exécuté par une session ou par le thread de rechargement (prebuild).
+    """
+    if watermarking.WATERMARK_MODE == "aggregate":
+        # Bruit sur les cellules de l'agrégat de base (O(groupes)) : tous les
+        # graphiques en sont des sommes, donc cohérents et vérifiables.
+        # Aucune expédition exacte n'est transmise à la session : seulement le cube.
+        base = watermarking.apply_aggregate_watermark(snapshot.cube.base, username, CUBE_DIMENSIONS)
+        return MasterSnapshot(snapshot.version, None, OlapCube(base))
+
+    df_watermarked = watermarking.apply_watermark(snapshot.data, username, log=False)
+
+    # Cube agrégé depuis les données watermarkées : graphiques au même watermark
+    return MasterSnapshot(snapshot.version, df_watermarked, OlapCube.from_shipments(df_watermarked))
+
+def display_header(cube):
     """Affiche l'en-tête WATCHAI avec logo et statistiques globales"""
 
     # Charger l'image en base64 pour intégration directe
@@ -424,10 +518,11 @@ def display_header(df):
     # Métriques globales
     col1, col2, col3, col4 = st.columns(4)
     
-    total_volume = df['POIDS_TONNES'].sum() / 1_000_000
-    total_operations = len(df)
-    nb_seasons = df['SAISON'].nunique()
-    nb_exporters = df['EXPORTATEUR SIMPLE'].nunique()
+    totals = cube.query().iloc[0]
+    total_volume = totals['POIDS_TONNES'] / 1_000_000
+    total_operations = int(totals['NB_LIGNES'])
+    nb_seasons = len(cube.query(['SAISON']))
+    nb_exporters = len(cube.query(['EXPORTATEUR SIMPLE']))
     
     with col1:
         st.metric("Volume Total", f"{total_volume:.1f}M tonnes", 
@@ -442,9 +537,9 @@ def display_header(df):
         st.metric("Exportateurs", f"{nb_exporters:,}", 
                  help="Nombre d'exportateurs uniques")
 
-def create_season_evolution(df):
+def create_season_evolution(cube):
     """Graphique évolution par saison"""
-    season_volumes = df.groupby('SAISON')['POIDS_TONNES'].sum().reset_index()
+    season_volumes = cube.query(['SAISON'])
     season_volumes = season_volumes.sort_values('SAISON')
     
     fig = go.Figure()
@@ -487,13 +582,12 @@ def create_season_evolution(df):
     
     return fig
 
-def create_monthly_pattern(df, season=None):
+def create_monthly_pattern(cube, season=None):
     """Graphique pattern mensuel"""
+    filters = {'SAISON': season} if season else None
     if season:
-        df_filtered = df[df['SAISON'] == season]
         title = f"Pattern Mensuel - Saison {season}"
     else:
-        df_filtered = df
         title = "Pattern Mensuel - Toutes Saisons"
     
     # Ordre des mois dans une saison cacaoyère
@@ -502,7 +596,7 @@ def create_monthly_pattern(df, season=None):
                    4: 'Avr', 5: 'Mai', 6: 'Juin',
                    7: 'Juil', 8: 'Août', 9: 'Sept'}
     
-    monthly_data = df_filtered.groupby('MOIS')['POIDS_TONNES'].sum().reset_index()
+    monthly_data = cube.query(['MOIS'], filters)
     monthly_data['MOIS_NOM'] = monthly_data['MOIS'].map(months_order)
     monthly_data['ORDER'] = monthly_data['MOIS'].map({10:1, 11:2, 12:3, 1:4, 2:5, 3:6, 4:7, 5:8, 6:9, 7:10, 8:11, 9:12})
     monthly_data = monthly_data.sort_values('ORDER')
@@ -530,16 +624,15 @@ def create_monthly_pattern(df, season=None):
     
     return fig
 
-def create_top_exporters(df, season=None, top_n=15):
+def create_top_exporters(cube, season=None, top_n=15):
     """Graphique top exportateurs"""
+    filters = {'SAISON': season} if season else None
     if season:
-        df_filtered = df[df['SAISON'] == season]
         title = f"Top {top_n} Exportateurs - {season}"
     else:
-        df_filtered = df
         title = f"Top {top_n} Exportateurs - Toutes Saisons"
     
-    top_exp = df_filtered.groupby('EXPORTATEUR SIMPLE')['POIDS_TONNES'].sum().nlargest(top_n).reset_index()
+    top_exp = cube.query(['EXPORTATEUR SIMPLE'], filters).nlargest(top_n, 'POIDS_TONNES')
     
     fig = go.Figure(data=[
         go.Bar(
@@ -567,17 +660,17 @@ def create_top_exporters(df, season=None, top_n=15):
     
     return fig
 
-def create_destinations_map(df, season=None):
+def create_destinations_map(cube, season=None):
     """Carte des destinations"""
+    filters = {'SAISON': season} if season else None
     if season:
-        df_filtered = df[df['SAISON'] == season]
         title = f"Destinations - {season}"
     else:
-        df_filtered = df
         title = "Destinations - Toutes Saisons"
     
-    dest_data = df_filtered.groupby('DESTINATION')['POIDS_TONNES'].sum().reset_index()
-    dest_data['PAYS'] = dest_data['DESTINATION'].map(COUNTRY_NAMES).fillna(dest_data['DESTINATION'])
+    dest_data = cube.query(['DESTINATION'], filters)
+    destinations = dest_data['DESTINATION'].astype(object)
+    dest_data['PAYS'] = destinations.map(COUNTRY_NAMES).fillna(destinations)
     dest_data = dest_data.nlargest(15, 'POIDS_TONNES')
     
     fig = go.Figure(data=[
@@ -604,16 +697,15 @@ def create_destinations_map(df, season=None):
     
     return fig
 
-def create_ports_distribution(df, season=None):
+def create_ports_distribution(cube, season=None):
     """Distribution par port"""
+    filters = {'SAISON': season} if season else None
     if season:
-        df_filtered = df[df['SAISON'] == season]
         title = f"Répartition par Port - {season}"
     else:
-        df_filtered = df
         title = "Répartition par Port"
     
-    port_data = df_filtered.groupby('PORT')['POIDS_TONNES'].sum().reset_index()
+    port_data = cube.query(['PORT'], filters)
     
     fig = go.Figure(data=[
         go.Pie(
@@ -633,16 +725,15 @@ def create_ports_distribution(df, season=None):
     
     return fig
 
-def create_products_mix(df, season=None):
+def create_products_mix(cube, season=None):
     """Mix produits"""
+    filters = {'SAISON': season} if season else None
     if season:
-        df_filtered = df[df['SAISON'] == season]
         title = f"Mix Produits - {season}"
     else:
-        df_filtered = df
         title = "Mix Produits Global"
     
-    product_data = df_filtered.groupby('PRODUIT')['POIDS_TONNES'].sum().reset_index()
+    product_data = cube.query(['PRODUIT'], filters)
     product_data = product_data.sort_values('POIDS_TONNES', ascending=False)
     
     fig = go.Figure(data=[
@@ -663,9 +754,16 @@ def create_products_mix(df, season=None):
     
     return fig
 
-def display_season_analysis(df, season):
+def season_stats(cube, dimension, filters):
+    """Volume total, moyen et nombre d'opérations par valeur de dimension"""
+    stats = cube.query([dimension], filters)
+    stats['MOYENNE'] = stats['POIDS_TONNES'] / stats['NB_OPERATIONS'].where(stats['NB_OPERATIONS'] > 0)
+    return stats[[dimension, 'POIDS_TONNES', 'MOYENNE', 'NB_OPERATIONS']]
+
+def display_season_analysis(cube, season):
     """Affiche l'analyse détaillée d'une saison"""
-    df_season = df[df['SAISON'] == season]
+    filters = {'SAISON': season}
+    totals = cube.query([], filters).iloc[0]
     
     # Alerte si saison incomplète
     if season in INCOMPLETE_SEASONS:
@@ -675,19 +773,19 @@ def display_season_analysis(df, season):
     col1, col2, col3, col4 = st.columns(4)
     
     with col1:
-        volume = df_season['POIDS_TONNES'].sum()
+        volume = totals['POIDS_TONNES']
         st.metric("Volume Saison", f"{volume:,.0f} tonnes")
     
     with col2:
-        operations = len(df_season)
+        operations = int(totals['NB_LIGNES'])
         st.metric("Opérations", f"{operations:,}")
     
     with col3:
-        exporters = df_season['EXPORTATEUR SIMPLE'].nunique()
+        exporters = len(cube.query(['EXPORTATEUR SIMPLE'], filters))
         st.metric("Exportateurs", f"{exporters:,}")
     
     with col4:
-        avg_shipment = df_season['POIDS_TONNES'].mean()
+        avg_shipment = totals['POIDS_TONNES'] / totals['NB_OPERATIONS'] if totals['NB_OPERATIONS'] else np.nan
         st.metric("Envoi Moyen", f"{avg_shipment:,.0f} tonnes")
     
     # Graphiques
@@ -696,14 +794,14 @@ def display_season_analysis(df, season):
     )
     
     with tab1:
-        st.plotly_chart(create_monthly_pattern(df, season), use_container_width=True)
+        st.plotly_chart(create_monthly_pattern(cube, season), use_container_width=True)
     
     with tab2:
-        st.plotly_chart(create_top_exporters(df, season), use_container_width=True)
+        st.plotly_chart(create_top_exporters(cube, season), use_container_width=True)
         
         # Table détaillée
         with st.expander("Voir le détail complet"):
-            exp_data = df_season.groupby('EXPORTATEUR SIMPLE')['POIDS_TONNES'].agg(['sum', 'count']).reset_index()
+            exp_data = cube.query(['EXPORTATEUR SIMPLE'], filters)[['EXPORTATEUR SIMPLE', 'POIDS_TONNES', 'NB_OPERATIONS']]
             exp_data.columns = ['Exportateur', 'Volume Total (tonnes)', 'Nb Opérations']
             exp_data = exp_data.sort_values('Volume Total (tonnes)', ascending=False)
             # Formatter les colonnes numériques
@@ -712,13 +810,13 @@ def display_season_analysis(df, season):
             st.dataframe(exp_data, use_container_width=True)
     
     with tab3:
-        st.plotly_chart(create_destinations_map(df, season), use_container_width=True)
+        st.plotly_chart(create_destinations_map(cube, season), use_container_width=True)
         
         # Top clients
         col1, col2 = st.columns(2)
         with col1:
             st.subheader("Top 10 Clients")
-            top_clients = df_season.groupby('DESTINATAIRE SIMPLE')['POIDS_TONNES'].sum().nlargest(10)
+            top_clients = cube.query(['DESTINATAIRE SIMPLE'], filters).set_index('DESTINATAIRE SIMPLE')['POIDS_TONNES'].nlargest(10)
             top_clients_df = top_clients.reset_index()
             top_clients_df.columns = ['Client', 'Volume (tonnes)']
             top_clients_df['Volume (tonnes)'] = top_clients_df['Volume (tonnes)'].apply(lambda x: f"{x:,.0f}")
@@ -726,7 +824,7 @@ def display_season_analysis(df, season):
         
         with col2:
             st.subheader("Top 10 Pays")
-            top_countries = df_season.groupby('DESTINATION')['POIDS_TONNES'].sum().nlargest(10)
+            top_countries = cube.query(['DESTINATION'], filters).set_index('DESTINATION')['POIDS_TONNES'].nlargest(10)
             top_countries_df = top_countries.reset_index()
             top_countries_df.columns = ['Code Pays', 'Volume (tonnes)']
             top_countries_df['Code Pays'] = top_countries_df['Code Pays'].map(lambda x: COUNTRY_NAMES.get(x, x))
@@ -734,10 +832,10 @@ def display_season_analysis(df, season):
             st.dataframe(top_countries_df, use_container_width=True)
     
     with tab4:
-        st.plotly_chart(create_products_mix(df, season), use_container_width=True)
+        st.plotly_chart(create_products_mix(cube, season), use_container_width=True)
         
         # Détail par produit
-        product_detail = df_season.groupby('PRODUIT')['POIDS_TONNES'].agg(['sum', 'mean', 'count']).reset_index()
+        product_detail = season_stats(cube, 'PRODUIT', filters)
         product_detail.columns = ['Produit', 'Volume Total', 'Volume Moyen', 'Nb Opérations']
         product_detail = product_detail.sort_values('Volume Total', ascending=False)
         # Formatter les colonnes numériques
@@ -749,12 +847,10 @@ def display_season_analysis(df, season):
     with tab5:
         col1, col2 = st.columns(2)
         with col1:
-            st.plotly_chart(create_ports_distribution(df, season), use_container_width=True)
+            st.plotly_chart(create_ports_distribution(cube, season), use_container_width=True)
         
         with col2:
-            port_stats = df_season.groupby('PORT').agg({
-                'POIDS_TONNES': ['sum', 'mean', 'count']
-            }).reset_index()
+            port_stats = season_stats(cube, 'PORT', filters)
             port_stats.columns = ['Port', 'Volume Total', 'Volume Moyen', 'Nb Opérations']
             # Formatter les colonnes numériques
             port_stats['Volume Total'] = port_stats['Volume Total'].apply(lambda x: f"{x:,.0f}")
@@ -925,6 +1021,7 @@ def main():
         if WATERMARKING_ENABLED:
             wm_info = watermarking.get_watermark_info("Julien")
             security_info.append(f"- Watermark: {wm_info['type']}")
+            security_info.append(f"- Mode watermark: {watermarking.WATERMARK_MODE}")
 
         if security_info:
             st.sidebar.markdown(f"""
@@ -961,14 +1058,18 @@ def main():
     
     # Chargement des données
     with st.spinner("Chargement des données..."):
-        df = load_data()
+        snapshot = load_master_snapshot()
+        user_data = load_user_data(snapshot)
     
-    if df is None:
+    if user_data is None:
         st.error("Impossible de charger les données. Vérifiez que DB_Shipping_Master.xlsx est présent.")
         return
+
+    # Cube pré-agrégé de l'utilisateur : seule source des graphiques et des listes de saisons
+    cube = user_data.cube
     
     # Header
-    display_header(df)
+    display_header(cube)
     
     st.markdown("---")
     
@@ -982,24 +1083,24 @@ def main():
         st.header("Vue Globale - Toutes Saisons")
         
         # Évolution temporelle
-        st.plotly_chart(create_season_evolution(df), use_container_width=True)
+        st.plotly_chart(create_season_evolution(cube), use_container_width=True)
         
         # Graphiques en colonnes
         col1, col2 = st.columns(2)
         
         with col1:
-            st.plotly_chart(create_ports_distribution(df), use_container_width=True)
+            st.plotly_chart(create_ports_distribution(cube), use_container_width=True)
         
         with col2:
-            st.plotly_chart(create_products_mix(df), use_container_width=True)
+            st.plotly_chart(create_products_mix(cube), use_container_width=True)
         
         # Top exportateurs et destinations
-        st.plotly_chart(create_top_exporters(df), use_container_width=True)
-        st.plotly_chart(create_destinations_map(df), use_container_width=True)
+        st.plotly_chart(create_top_exporters(cube), use_container_width=True)
+        st.plotly_chart(create_destinations_map(cube), use_container_width=True)
     
     elif analysis_mode == "Analyse par Saison":
         # Sélection de la saison
-        seasons = sorted(df['SAISON'].unique(), reverse=True)
+        seasons = cube.seasons()[::-1]
         
         # Ajouter indicateur pour saisons incomplètes
         selected_season = st.sidebar.selectbox(
@@ -1009,13 +1110,13 @@ def main():
         )
         
         st.header(f"Analyse Saison {selected_season}")
-        display_season_analysis(df, selected_season)
+        display_season_analysis(cube, selected_season)
     
     else:  # Analyse Comparative
         st.header("Analyse Comparative")
         
         # Sélection de plusieurs saisons
-        seasons = sorted(df['SAISON'].unique())
+        seasons = cube.seasons()
         selected_seasons = st.sidebar.multiselect(
             "Sélectionner les saisons à comparer",
             options=seasons,
@@ -1029,16 +1130,15 @@ def main():
             st.sidebar.markdown("---")
             st.sidebar.subheader("Filtres")
             
-            # Préparer les données pour les filtres - garder df_base intacte
-            df_base = df[df['SAISON'].isin(selected_seasons)]
+            # Requêtes comparatives sur le cube : un group-by par dimension pour toutes les saisons
+            query = ComparativeQuery(cube, selected_seasons)
             
             # Préparer toutes les listes AVANT de créer les multiselects
-            exportateurs = sorted(df_base['EXPORTATEUR SIMPLE'].unique())
-            destinataires = sorted(df_base['DESTINATAIRE SIMPLE'].unique())
-            destinations_raw = df_base['DESTINATION'].unique()
-            destinations = sorted([str(d) for d in destinations_raw if pd.notna(d)])
+            exportateurs = query.options('EXPORTATEUR SIMPLE')
+            destinataires = query.options('DESTINATAIRE SIMPLE')
+            destinations = [str(d) for d in query.options('DESTINATION')]
             destinations_with_names = [f"{code} - {COUNTRY_NAMES.get(code, code)}" for code in destinations]
-            produits = sorted(df_base['PRODUIT'].unique())
+            produits = query.options('PRODUIT')
             
             # Créer les multiselects avec les bonnes listes
             selected_exportateurs = st.sidebar.multiselect(
@@ -1070,33 +1170,17 @@ def main():
                 key="filter_produits"
             )
             
-            # Appliquer les filtres sur df_base
-            df_filtered = df_base.copy()
-            if selected_exportateurs:
-                df_filtered = df_filtered[df_filtered['EXPORTATEUR SIMPLE'].isin(selected_exportateurs)]
-            if selected_destinataires:
-                df_filtered = df_filtered[df_filtered['DESTINATAIRE SIMPLE'].isin(selected_destinataires)]
-            if selected_destinations:
-                df_filtered = df_filtered[df_filtered['DESTINATION'].isin(selected_destinations)]
-            if selected_produits:
-                df_filtered = df_filtered[df_filtered['PRODUIT'].isin(selected_produits)]
-            
-            # Utiliser df_filtered pour la suite
-            df = df_filtered
+            # Appliquer les filtres (sur les saisons sélectionnées)
+            query = ComparativeQuery(cube, selected_seasons, {
+                'EXPORTATEUR SIMPLE': selected_exportateurs,
+                'DESTINATAIRE SIMPLE': selected_destinataires,
+                'DESTINATION': selected_destinations,
+                'PRODUIT': selected_produits,
+            })
+
             # Métriques générales
             st.subheader(" Vue d'ensemble")
-            comparison_data = []
-            for season in selected_seasons:
-                df_s = df[df['SAISON'] == season]
-                comparison_data.append({
-                    'Saison': season,
-                    'Volume Total': df_s['POIDS_TONNES'].sum(),
-                    'Opérations': len(df_s),
-                    'Exportateurs': df_s['EXPORTATEUR SIMPLE'].nunique(),
-                    'Destinations': df_s['DESTINATION'].nunique()
-                })
-            
-            comp_df = pd.DataFrame(comparison_data)
+            comp_df = query.overview()
             comp_display = comp_df.copy()
             comp_display['Volume Total'] = comp_display['Volume Total'].apply(lambda x: f"{x:,.0f}")
             comp_display['Opérations'] = comp_display['Opérations'].apply(lambda x: f"{x:,}")
@@ -1110,10 +1194,10 @@ def main():
             with col1:
                 st.subheader("🏭 Top 5 Exportateurs")
                 # Top 5 exportateurs pour chaque saison
+                top_exporters = query.top_by_season('EXPORTATEUR SIMPLE', 5)
                 fig_exp = go.Figure()
                 for i, season in enumerate(selected_seasons):
-                    df_s = df[df['SAISON'] == season]
-                    top_exp = df_s.groupby('EXPORTATEUR SIMPLE')['POIDS_TONNES'].sum().nlargest(5)
+                    top_exp = top_exporters[season]
                     
                     fig_exp.add_trace(go.Bar(
                         name=season,
@@ -1139,10 +1223,10 @@ def main():
             with col2:
                 st.subheader(" Top 5 Destinataires")
                 # Top 5 destinataires pour chaque saison
+                top_consignees = query.top_by_season('DESTINATAIRE SIMPLE', 5)
                 fig_dest = go.Figure()
                 for i, season in enumerate(selected_seasons):
-                    df_s = df[df['SAISON'] == season]
-                    top_dest = df_s.groupby('DESTINATAIRE SIMPLE')['POIDS_TONNES'].sum().nlargest(5)
+                    top_dest = top_consignees[season]
                     
                     fig_dest.add_trace(go.Bar(
                         name=season,
@@ -1171,10 +1255,10 @@ def main():
             with col3:
                 st.subheader(" Top 5 Destinations (Pays)")
                 # Top 5 pays pour chaque saison
+                top_countries = query.top_by_season('DESTINATION', 5)
                 fig_pays = go.Figure()
                 for i, season in enumerate(selected_seasons):
-                    df_s = df[df['SAISON'] == season]
-                    top_pays = df_s.groupby('DESTINATION')['POIDS_TONNES'].sum().nlargest(5)
+                    top_pays = top_countries[season]
                     # Convertir codes pays en noms
                     pays_names = [COUNTRY_NAMES.get(code, code) for code in top_pays.index]
                     
@@ -1202,13 +1286,12 @@ def main():
             with col4:
                 st.subheader("📦 Fèves vs Produits Transformés")
                 # Séparer Fèves et Produits transformés pour chaque saison
+                beans_split = query.beans_vs_processed()
                 fig_prod = go.Figure()
                 for i, season in enumerate(selected_seasons):
-                    df_s = df[df['SAISON'] == season]
-                    
-                    # Calculer les volumes Fèves vs Produits transformés
-                    feves_vol = df_s[df_s['PRODUIT'].str.contains('FEVE', case=False, na=False)]['POIDS_TONNES'].sum()
-                    produits_vol = df_s[~df_s['PRODUIT'].str.contains('FEVE', case=False, na=False)]['POIDS_TONNES'].sum()
+                    # Volumes Fèves vs Produits transformés
+                    feves_vol = beans_split.loc[season, 'Fèves']
+                    produits_vol = beans_split.loc[season, 'Produits Transformés']
                     
                     # Ajouter les barres
                     fig_prod.add_trace(go.Bar(
@@ -1233,12 +1316,11 @@ def main():
                 
                 # Détail des produits transformés
                 with st.expander("Voir détail des produits transformés"):
+                    processed = query.processed_products()
                     for season in selected_seasons:
-                        df_s = df[df['SAISON'] == season]
-                        # Exclure les fèves pour le détail
-                        df_produits = df_s[~df_s['PRODUIT'].str.contains('FEVE', case=False, na=False)]
-                        if not df_produits.empty:
-                            prod_detail = df_produits.groupby('PRODUIT')['POIDS_TONNES'].sum().sort_values(ascending=False)
+                        # Fèves exclues du détail
+                        prod_detail = processed[season]
+                        if not prod_detail.empty:
                             prod_df = prod_detail.reset_index()
                             prod_df.columns = ['Produit', 'Volume (tonnes)']
                             prod_df['Volume (tonnes)'] = prod_df['Volume (tonnes)'].apply(lambda x: f"{x:,.0f}")
@@ -1251,10 +1333,10 @@ def main():
             
             with col5:
                 # Graphique en barres
+                ports_by_season = query.by_season(query.totals('PORT'), 'PORT')
                 fig_ports = go.Figure()
                 for i, season in enumerate(selected_seasons):
-                    df_s = df[df['SAISON'] == season]
-                    port_data = df_s.groupby('PORT')['POIDS_TONNES'].sum()
+                    port_data = ports_by_season[season]
                     
                     fig_ports.add_trace(go.Bar(
                         name=season,
@@ -1279,18 +1361,13 @@ def main():
             with col6:
                 # Tableau détaillé des ports
                 st.subheader("Détail par Port")
+                ports_detail = query.port_detail()
                 for season in selected_seasons:
-                    df_s = df[df['SAISON'] == season]
-                    port_detail = df_s.groupby('PORT')['POIDS_TONNES'].agg(['sum', 'count']).reset_index()
-                    port_detail.columns = ['Port', 'Volume (tonnes)', 'Nb Opérations']
+                    port_detail = ports_detail[season].copy()
+                    port_detail.columns = ['Port', 'Volume (tonnes)', 'Nb Opérations', '%']
                     port_detail['Volume (tonnes)'] = port_detail['Volume (tonnes)'].apply(lambda x: f"{x:,.0f}")
                     port_detail['Nb Opérations'] = port_detail['Nb Opérations'].apply(lambda x: f"{x:,}")
-                    
-                    # Calculer le pourcentage
-                    total_volume = df_s['POIDS_TONNES'].sum()
-                    port_detail['%'] = df_s.groupby('PORT')['POIDS_TONNES'].sum().reset_index()['POIDS_TONNES'].apply(
-                        lambda x: f"{(x/total_volume*100):.1f}%"
-                    )
+                    port_detail['%'] = port_detail['%'].apply(lambda x: f"{(x*100):.1f}%")
                     
                     st.write(f"**{season}**")
                     st.dataframe(port_detail, use_container_width=True)
@@ -1313,7 +1390,57 @@ def main():
         with col_cache:
             if st.button(" Vider Cache", help="Force le rechargement des données"):
                 st.cache_data.clear()
+                get_shared_dataset.clear()
+                get_user_datasets.clear()
                 st.rerun()
+        with col_space:
+            # Empreinte du master : les données sont rechargées dès qu'elle change
+            fingerprint = get_data_fingerprint()
+            if fingerprint:
+                version = f"v{fingerprint['version']} | " if fingerprint['version'] is not None else ""
+                st.caption(
+                    f"Données: {fingerprint['source']} | {version}"
+                    f"modifié {fingerprint['modified']} | {fingerprint['size'] / 1024:,.0f} Ko | "
+                    f"sha256 {fingerprint['sha256'][:12]}"
+                )
+
+            # Snapshot servi : l'ancien reste affiché pendant un rechargement
+            status = get_shared_dataset().status()
+            if status['refreshing']:
+                st.caption(f"🔄 Rechargement en arrière-plan (snapshot du {status['loaded_at']} servi)")
+            elif fingerprint and status['version'] != fingerprint['key']:
+                st.caption(f"⏳ Nouvelle version détectée (snapshot du {status['loaded_at']} servi)")
+            if status['last_error']:
+                st.caption(f"⚠️ Dernier rechargement en échec: {status['last_error']}")
+
+            # Jeux watermarkés en mémoire (LRU par utilisateur et version)
+            cache_stats = get_user_datasets().stats()
+            st.caption(
+                f"Cache watermark: {cache_stats['entries']}/{cache_stats['max_entries']} "
+                f"({', '.join(cache_stats['users']) or 'vide'}) | "
+                f"{cache_stats['hits']} hits / {cache_stats['misses']} calculs"
+            )
+
+        with st.expander("💾 Mémoire du dataset (Admin)", expanded=False):
+            report = snapshot.memory_report()
+            total = report.iloc[-1]
+            col1, col2, col3 = st.columns(3)
+            with col1:
+                st.metric("Avant encodage", f"{total['Avant (octets)'] / 1024**2:,.1f} Mo")
+            with col2:
+                st.metric("Après encodage", f"{total['Après (octets)'] / 1024**2:,.1f} Mo")
+            with col3:
+                st.metric("Réduction", f"{total['Réduction']:.0%}")
+
+            st.dataframe(
+                report.style.format({
+                    'Avant (octets)': '{:,.0f}',
+                    'Après (octets)': '{:,.0f}',
+                    'Réduction': '{:.0%}'
+                }, na_rep='-'),
+                use_container_width=True,
+                hide_index=True
+            )
         
         with st.expander("🔍 Console de Logs - WATCHAI (Admin)", expanded=False):
             if LOGGING_ENABLED:
@@ -1324,7 +1451,7 @@ def main():
                 col1, col2, col3, col4 = st.columns(4)
 
                 with col1:
-                    st.metric("Sessions totales", stats.get('total', 0))
+                    st.metric(f"Sessions ({watchai_logger.STATS_WINDOW_DAYS} j)", stats.get('total', 0))
 
                 with col2:
                     st.metric("Sessions aujourd'hui", stats.get('today', 0))
@@ -1367,26 +1494,18 @@ def main():
                     # Sessions des dernières heures
                     hours_filter = st.selectbox("Afficher les sessions des dernières:", [1, 6, 12, 24], index=1)
 
-                    recent_sessions = watchai_logger.get_recent_sessions(500)
-                    if recent_sessions:
-                        # Filtrer par heures
-                        from datetime import timedelta
-                        cutoff_time = datetime.now() - timedelta(hours=hours_filter)
-                        filtered_sessions = []
-
-                        for session in recent_sessions:
-                            try:
-                                session_time = datetime.fromisoformat(session['timestamp'])
-                                if session_time >= cutoff_time:
-                                    filtered_sessions.append(session)
-                            except:
-                                continue
+                    # Plage de temps résolue par la base de logs (index sur l'horodatage)
+                    from datetime import timedelta
+                    cutoff_time = datetime.now() - timedelta(hours=hours_filter)
+                    filtered_sessions = watchai_logger.get_sessions_since(cutoff_time, limit=20)
 
+                    if filtered_sessions or stats.get('total', 0):
                         if filtered_sessions:
-                            st.write(f"**{len(filtered_sessions)} sessions** dans les {hours_filter} dernières heures")
+                            session_count = watchai_logger.count_sessions(since=cutoff_time)
+                            st.write(f"**{session_count} sessions** dans les {hours_filter} dernières heures")
 
                             # Affichage des sessions
-                            for session in filtered_sessions[-20:]:  # 20 dernières sessions
+                            for session in filtered_sessions:  # 20 dernières sessions
                                 timestamp = datetime.fromisoformat(session['timestamp']).strftime('%Y-%m-%d %H:%M:%S')
                                 st.markdown(f"""
                                 <div style="background: white; border-left: 4px solid #4DBDB3; padding: 8px; margin: 4px 0; border-radius: 4px;">
@@ -1408,15 +1527,12 @@ def main():
 
                     try:
                         if log_type == "Access Logs":
-                            log_file = "/Users/julienmarboeuf/Documents/BON PLEIN/WATCHAI/Logs/access.log"
+                            log_file = watchai_logger.access_log_file
                         else:
-                            log_file = "/Users/julienmarboeuf/Documents/BON PLEIN/WATCHAI/Logs/activity.log"
+                            log_file = watchai_logger.activity_log_file
 
                         if Path(log_file).exists():
-                            with open(log_file, 'r', encoding='utf-8') as f:
-                                lines = f.readlines()
-
-                            recent_lines = lines[-num_lines:]
+                            recent_lines = tail_log(log_file, num_lines)
 
                             for line in reversed(recent_lines):
                                 if line.strip():